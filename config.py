@@ -3,5 +3,25 @@ from interactions import MISSING
 "Enable DEBUG messages for logging"
 DEBUG = False
 
+"""Also write logs as JSON lines to this file, rotated by size. None logs to the console only"""
+LOG_JSON_FILE = None
+LOG_JSON_MAX_BYTES = 5 * 1024 * 1024
+LOG_JSON_BACKUPS = 3
+
 """The scope for your bot to operate in. This should be a guild ID or list of guild IDs"""
 DEV_GUILD = 398677618985009152
+
+"""Role allowed to use the admin commands (application handling, config reloads, stats)"""
+ADMIN_OFFICER_ROLE_ID = 1057490528805077102
+
+"""Keep members in the squadron index's compact cache and cap the library's member cache (saves memory on large guilds)"""
+COMPACT_MEMBER_CACHE = False
+
+"""How many members the library keeps cached while COMPACT_MEMBER_CACHE is on"""
+LIBRARY_MEMBER_CACHE_LIMIT = 1000
+
+"""Extensions (e.g. "extensions.roster") constructed only after the bot has logged in, so it answers commands sooner after a restart"""
+DEFERRED_EXTENSIONS = []
+
+"""Serve Prometheus metrics on http://127.0.0.1:<port>/metrics, or None to disable"""
+METRICS_PORT = None
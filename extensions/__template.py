@@ -14,6 +14,15 @@ from src import logutil
 "Change this if you'd like - this labels log messages for debug mode"
 logger = logutil.init_logger(os.path.basename(__file__))
 
+"""
+Gateway intents this extension needs. main.py connects with the union of
+every extension's INTENTS, so only events some extension uses are received.
+List library caches you read from (e.g. "message_cache") in CACHES, or
+main.py may shrink or disable them
+"""
+INTENTS = interactions.Intents.GUILDS
+CACHES = ()
+
 
 class TemplateCog(interactions.Extension):
     @interactions.slash_command(
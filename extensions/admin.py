@@ -0,0 +1,113 @@
+import os
+import time
+import interactions
+from config import DEV_GUILD
+from src import logutil
+from src import configcache
+from src.embeds import build_embeds, chunk_lines, group_for_messages
+from src.metrics import get_metrics
+from src.permissions import is_admin
+
+logger = logutil.init_logger(os.path.basename(__file__))
+
+INTENTS = interactions.Intents.GUILDS
+
+
+STATS_TOP = 10  # rows per /botstats section
+
+
+def latency_lines(table):
+    rows = sorted(table.items(), key=lambda item: -item[1].count)[:STATS_TOP]
+    return [
+        f"{name}: {hist.count}x, p50 {hist.quantile(0.5):.2f}s, p95 {hist.quantile(0.95):.2f}s, max {hist.max:.2f}s"
+        for name, hist in rows
+    ]
+
+
+class Admin(interactions.Extension):
+    def __init__(self, bot):
+        self.bot = bot
+        logger.debug("Admin extension initialized.")
+
+    @interactions.slash_command(
+        name="reloadconfig",
+        description="Reload the JSON configuration files",
+        scopes=[DEV_GUILD] if DEV_GUILD else None
+    )
+    async def reloadconfig_command(self, ctx: interactions.SlashContext):
+        logger.debug("reloadconfig command invoked.")
+        if not is_admin(ctx):
+            await ctx.send("You do not have the required permissions to use this command.", ephemeral=True)
+            return
+
+        paths = [configcache.APPLICATION_FILE, configcache.SQ_ROLES_FILE, configcache.ANNOUNCEMENT_BODIES_FILE]
+        results = configcache.reload(paths)
+        lines = [
+            f"{path}: {'reloaded' if error is None else f'failed ({error})'}"
+            for path, error in results.items()
+        ]
+        logger.info("Config reloaded by %s", ctx.author.username)
+        await ctx.send("\n".join(lines), ephemeral=True)
+
+    @interactions.slash_command(
+        name="startupreport",
+        description="Show how long each extension took to start",
+        scopes=[DEV_GUILD] if DEV_GUILD else None
+    )
+    async def startupreport_command(self, ctx: interactions.SlashContext):
+        logger.debug("startupreport command invoked.")
+        if not is_admin(ctx):
+            await ctx.send("You do not have the required permissions to use this command.", ephemeral=True)
+            return
+
+        timeline = getattr(self.bot, "startup", None)
+        if timeline is None:
+            await ctx.send("No startup timeline was recorded.", ephemeral=True)
+            return
+        await ctx.send("```\n" + "\n".join(timeline.report()) + "\n```", ephemeral=True)
+
+    @interactions.slash_command(
+        name="botstats",
+        description="Show command latency, REST usage, gateway events and event loop lag",
+        scopes=[DEV_GUILD] if DEV_GUILD else None
+    )
+    async def botstats_command(self, ctx: interactions.SlashContext):
+        logger.debug("botstats command invoked.")
+        if not is_admin(ctx):
+            await ctx.send("You do not have the required permissions to use this command.", ephemeral=True)
+            return
+
+        metrics = get_metrics()
+        lag = metrics.loop_lag
+        uptime = int(time.time() - metrics.started)
+        description = (
+            f"Uptime {uptime // 3600}h {uptime % 3600 // 60}m. "
+            f"Event loop lag: last {metrics.last_loop_lag * 1000:.0f}ms, "
+            f"p95 {lag.quantile(0.95) * 1000:.0f}ms, max {lag.max * 1000:.0f}ms"
+        )
+
+        routes = [
+            f"{route}: {calls} calls, {metrics.rest_failures[route]} failed, {metrics.rest_rate_limited[route]} rate limited"
+            for route, calls in metrics.rest_calls.most_common(STATS_TOP)
+        ]
+        events = [f"{event_type}: {count}" for event_type, count in metrics.gateway_events.most_common(STATS_TOP)]
+        sections = [
+            ("Commands", latency_lines(metrics.commands)),
+            ("Components", latency_lines(metrics.components)),
+            ("REST routes", routes),
+            ("Gateway events", events),
+        ]
+
+        fields = []
+        for title, lines in sections:
+            for i, chunk in enumerate(chunk_lines(lines or ["None yet"])):
+                fields.append((title if i == 0 else f"{title} (cont.)", chunk))
+
+        embeds = build_embeds("Bot stats", fields, description=description, color=0x1a9ca8)
+        for batch in group_for_messages(embeds):
+            await ctx.send(embeds=batch, ephemeral=True)
+
+def setup(bot):
+    logger.debug("Setting up Admin extension...")
+    Admin(bot)
+    logger.debug("Admin extension setup complete")
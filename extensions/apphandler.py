@@ -1,5 +1,5 @@
-import csv
-import json
+import io
+import os
 import asyncio
 from datetime import datetime
 import interactions
@@ -7,82 +7,97 @@ import re
 import random
 import logging
 from interactions import Extension, listen, SlashContext, Client, ActionRow, StringSelectMenu, StringSelectOption, Button, ButtonStyle, ComponentContext, slash_command, Embed
+from config import ADMIN_OFFICER_ROLE_ID, DEV_GUILD
+from src import logutil
+from src.appstore import get_store
+from src.configcache import announcement_bodies, application_config
+from src.dispatcher import PRIORITY_ALERT, get_dispatcher
+from src.events import ApplicationSubmitted
+from src.permissions import is_admin
+from src.timing import StepTimer
 
-CSV_FILE = 'applications.csv'
-ANNOUNCEMENT_BODIES_FILE = 'announcement_bodies.json'
 APP_HANDLER_CHANNEL_ID = 1135406342224482455
-ADMIN_OFFICER_ROLE_ID = 1057490528805077102
 GENERAL_ROLE_ID = 400211354654343169
 RECRUIT_ROLE_ID = 471107205731450901
 ANNOUNCEMENT_CHANNEL_ID = 491080449540751381
 
-with open('application.json', 'r') as file:
-    config = json.load(file)
+logger = logutil.init_logger(os.path.basename(__file__))
+
+INTENTS = interactions.Intents.GUILDS | interactions.Intents.GUILD_MEMBERS
+
+OUTBOX_RETRY_INTERVAL = 60  # seconds between retries of applications that failed to post
+OUTBOX_MAX_RETRY_INTERVAL = 15 * 60
 
 class ApplicationHandler(Extension):
     def __init__(self, bot: Client):
         self.bot = bot
+        self.store = get_store()
+        self.posting = set()
+        self.dispatcher = get_dispatcher(bot)
+        self.outbox_task = None
 
-    def get_pending_applications(self):
-        pending_applications = []
-        try:
-            with open(CSV_FILE, 'r') as file:
-                reader = csv.DictReader(file)
-                for row in reader:
-                    if row["Status"] == "Pending":
-                        pending_applications.append(row)
-        except FileNotFoundError:
-            return []
+    def drop(self):
+        if self.outbox_task:
+            self.outbox_task.cancel()
+        super().drop()
 
-        return pending_applications
+    def get_pending_applications(self):
+        return self.store.by_status("Pending")
 
     def get_pending_no_post_applications(self):
-        no_post_applications = []
-        try:
-            with open(CSV_FILE, 'r') as file:
-                reader = csv.DictReader(file)
-                for row in reader:
-                    if row["Status"] == "Pending (No Post)":
-                        no_post_applications.append(row)
-        except FileNotFoundError:
-            return []
-
-        return no_post_applications
+        return self.store.by_status("Pending (No Post)")
 
     def update_application_status(self, user_id, new_status):
-        rows = []
-        with open(CSV_FILE, 'r') as file:
-            reader = csv.DictReader(file)
-            for row in reader:
-                if row["User ID"] == user_id:
-                    row["Status"] = new_status
-                rows.append(row)
-
-        with open(CSV_FILE, 'w', newline='') as file:
-            writer = csv.DictWriter(file, fieldnames=rows[0].keys())
-            writer.writeheader()
-            writer.writerows(rows)
-
-    async def check_new_applications(self):
+        # Only the pending application being handled, not the user's earlier ones
+        return self.store.update_status(user_id, new_status, old_status="Pending")
+
+    async def post_application(self, application):
+        """Post an application to the admins. Returns False if it stays in the outbox"""
+        user_id = application["User ID"]
+        if user_id in self.posting:
+            return True
+        self.posting.add(user_id)
+        try:
+            await self.notify_admins(application)
+            self.store.update_status(user_id, "Pending", old_status="Pending (No Post)")
+            return True
+        except Exception:
+            logger.exception("Failed to post application from %s, it will be retried", application["Username"])
+            return False
+        finally:
+            self.posting.discard(user_id)
+
+    async def flush_unposted_applications(self):
+        """Post applications submitted while the handler was offline or whose post failed.
+        Returns True when the outbox is empty"""
+        posted = True
+        for application in self.get_pending_no_post_applications():
+            posted = await self.post_application(application) and posted
+        return posted
+
+    async def retry_outbox(self):
+        # Failed posts stay "Pending (No Post)"; retry them, backing off while they keep failing
+        interval = OUTBOX_RETRY_INTERVAL
         while True:
-            await asyncio.sleep(60)  # Check every minute
-            no_post_applications = self.get_pending_no_post_applications()
-            for application in no_post_applications:
-                user_id = application["User ID"]
-                # If the status is "Pending (No Post)", send an alert and update the status to "Pending"
-                if application["Status"] == "Pending (No Post)":
-                    await self.notify_admins(application)
-                    self.update_application_status(user_id, "Pending")
+            await asyncio.sleep(interval)
+            if await self.flush_unposted_applications():
+                interval = OUTBOX_RETRY_INTERVAL
+            else:
+                interval = min(interval * 2, OUTBOX_MAX_RETRY_INTERVAL)
+
+    @listen(ApplicationSubmitted)
+    async def on_application_submitted(self, event: ApplicationSubmitted):
+        await self.post_application(event.application)
 
     async def notify_admins(self, application):
-        channel = await self.bot.fetch_channel(APP_HANDLER_CHANNEL_ID)
         message = (
             f"New application detected!\n"
             f"Username: {application['Username']}\n"
             f"Application Time: {application['Timestamp']}\n"
             f"To handle this application, use the `/handle` command."
         )
-        await channel.send(f"<@&{ADMIN_OFFICER_ROLE_ID}> {message}")
+        # Admin alerts jump ahead of anything else queued for the channel
+        await self.dispatcher.send(APP_HANDLER_CHANNEL_ID, f"<@&{ADMIN_OFFICER_ROLE_ID}> {message}", priority=PRIORITY_ALERT)
 
     @slash_command(
         name="handle",
@@ -90,7 +105,7 @@ class ApplicationHandler(Extension):
         scopes=[APP_HANDLER_CHANNEL_ID]
     )
     async def handle_cmd(self, ctx: SlashContext):
-        if ADMIN_OFFICER_ROLE_ID not in [role.id for role in ctx.author.roles]:
+        if not is_admin(ctx):
             await ctx.send("You do not have the required permissions to use this command.", ephemeral=True)
             return
 
@@ -117,22 +132,30 @@ class ApplicationHandler(Extension):
             ephemeral=True
         )
 
+    @slash_command(
+        name="exportapps",
+        description="Export all applications as a CSV file",
+        scopes=[DEV_GUILD] if DEV_GUILD else None
+    )
+    async def export_cmd(self, ctx: SlashContext):
+        if not is_admin(ctx):
+            await ctx.send("You do not have the required permissions to use this command.", ephemeral=True)
+            return
+
+        export = io.BytesIO(self.store.export_csv().encode())
+        await ctx.send(files=[interactions.File(export, file_name="applications.csv")], ephemeral=True)
+
     @listen()
     async def on_ready(self):
-        print(f'{self.bot.user.username} is ready and monitoring applications.')
-        asyncio.create_task(self.check_new_applications())
+        logger.info("%s is ready and monitoring applications.", self.bot.user.username)
+        await self.flush_unposted_applications()
+        if self.outbox_task is None:
+            self.outbox_task = asyncio.create_task(self.retry_outbox())
 
     @interactions.component_callback("application_select")
     async def application_select_callback(self, ctx: ComponentContext):
         selected_user_id = ctx.values[0]
-        selected_application = None
-
-        with open(CSV_FILE, 'r') as file:
-            reader = csv.DictReader(file)
-            for row in reader:
-                if row["User ID"] == selected_user_id:
-                    selected_application = row
-                    break
+        selected_application = self.store.get(selected_user_id)
 
         if selected_application:
             embed = Embed(
@@ -162,33 +185,23 @@ class ApplicationHandler(Extension):
             await ctx.send(embeds=[embed], components=[ActionRow(*buttons)], ephemeral=True)
 
     async def get_squadron_leadership(self, guild, squadron_role_id):
-        squadron_leadership = {"CO": None, "XO": None}
-
-        # Ensure all members are cached
-        await guild.chunk()
-
-        # Get all members in the guild
-        squadron_members = guild.members
-
-        for member in squadron_members:
-            if squadron_role_id in [r.id for r in member.roles]:
-                if member.nick and "[HVY]CO" in member.nick:
-                    squadron_leadership["CO"] = member.id
-                elif member.nick and "[HVY]XO" in member.nick:
-                    squadron_leadership["XO"] = member.id
-
-                if squadron_leadership["CO"] and squadron_leadership["XO"]:
-                    break
+        squadrons = self.bot.squadrons
+        if not squadrons.ready:
+            await squadrons.build()
+        return squadrons.leadership(squadron_role_id)
 
-        return squadron_leadership
+    async def send_decision_dm(self, user, dm_message):
+        try:
+            await user.send(dm_message)
+        except Exception as e:
+            await self.dispatcher.send(APP_HANDLER_CHANNEL_ID, f"Failed to send DM to {user.username}: {e}")
 
     @interactions.component_callback(re.compile(r'^accept_'))
     async def on_accept(self, ctx: ComponentContext):
+        await ctx.defer(ephemeral=True)
+        timer = StepTimer("Accept")
         user_id = ctx.custom_id.split('_')[1]
-        user = await self.bot.fetch_user(user_id)
-        guild = await self.bot.fetch_guild(ctx.guild_id)
-        member = await guild.fetch_member(user_id)
-        
+
         accept_timestamp = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
         admin_nickname = ctx.author.nick if ctx.author.nick else ctx.author.username
 
@@ -197,16 +210,13 @@ class ApplicationHandler(Extension):
         squadron_name = ""
         squadron_role_id = None
 
-        with open(CSV_FILE, 'r') as file:
-            reader = csv.DictReader(file)
-            for row in reader:
-                if row["User ID"] == user_id:
-                    requested_callsign = row["Requested Callsign"]
-                    squadron_name = row["Which Squadron are you applying to join?"]
-                    break
+        application = self.store.get(user_id)
+        if application:
+            requested_callsign = application["Requested Callsign"]
+            squadron_name = application["Which Squadron are you applying to join?"]
 
         # Assign the squadron role based on the selected squadron
-        for role_id, squadron in config["squadron_roles"].items():
+        for role_id, squadron in application_config()["squadron_roles"].items():
             if squadron["name"] == squadron_name:
                 squadron_role_id = int(role_id)
                 break
@@ -215,12 +225,19 @@ class ApplicationHandler(Extension):
             await ctx.send("Squadron role not found for the selected squadron.", ephemeral=True)
             return
 
-        # Change the nickname
+        # Independent lookups run together
+        user, member = await asyncio.gather(
+            timer.run("fetch_user", self.bot.fetch_user(user_id)),
+            timer.run("fetch_member", self.bot.fetch_member(user_id, ctx.guild_id)),
+        )
+
+        # Change the nickname and assign the roles in a single member edit
         new_nickname = f"[HVY](R){requested_callsign}"
-        await member.edit(nickname=new_nickname)
+        roles = {role.id for role in member.roles} | {GENERAL_ROLE_ID, RECRUIT_ROLE_ID, squadron_role_id}
+        await timer.run("member_edit", member.edit(nickname=new_nickname, roles=roles))
 
-        # Assign the roles
-        await member.add_roles([GENERAL_ROLE_ID, RECRUIT_ROLE_ID, squadron_role_id])
+        # Update the stored status to "Accepted"
+        self.update_application_status(user_id, "Accepted")
 
         # Create an embed to post in the handler channel
         embed = Embed(
@@ -229,11 +246,6 @@ class ApplicationHandler(Extension):
             color=0x00ff00
         )
 
-        # Post the embed in the handler channel
-        handler_channel = await self.bot.fetch_channel(APP_HANDLER_CHANNEL_ID)
-        await handler_channel.send(embeds=[embed])
-        
-        # Send a DM to the applicant
         dm_message = (
             f"Hello {user.username},\n\n"
             f"Congratulations! Your application to join Joint Task Force Heavy has been accepted. "
@@ -241,25 +253,14 @@ class ApplicationHandler(Extension):
             f"Best regards,\n"
             f"Joint Task Force Heavy Leadership"
         )
-        try:
-            await user.send(dm_message)
-        except Exception as e:
-            await handler_channel.send(f"Failed to send DM to {user.username}: {e}")
-
-        # Update the status in the CSV to "Accepted"
-        self.update_application_status(user_id, "Accepted")
 
         # Fetch squadron leadership
-        leadership = await self.get_squadron_leadership(guild, squadron_role_id)
+        leadership = await timer.run("leadership", self.get_squadron_leadership(ctx.guild, squadron_role_id))
         co_mention = f"<@{leadership.get('CO')}>" if leadership.get("CO") else "the CO"
         xo_mention = f"<@{leadership.get('XO')}>" if leadership.get("XO") else "the XO"
 
-        # Load announcement bodies
-        with open(ANNOUNCEMENT_BODIES_FILE, 'r') as file:
-            announcement_bodies = json.load(file)["announcements"]
-        
         # Select a random announcement body
-        announcement_body = random.choice(announcement_bodies)
+        announcement_body = random.choice(announcement_bodies())
 
         # Create an announcement
         announcement = (
@@ -267,23 +268,30 @@ class ApplicationHandler(Extension):
             f"{announcement_body}"
         )
 
-        # Send the announcement
-        announcement_channel = await self.bot.fetch_channel(ANNOUNCEMENT_CHANNEL_ID)
-        await announcement_channel.send(announcement)
+        # Handler post, DM and announcement don't depend on each other
+        await asyncio.gather(
+            timer.run("handler_post", self.dispatcher.send(APP_HANDLER_CHANNEL_ID, embeds=[embed])),
+            timer.run("dm", self.send_decision_dm(user, dm_message)),
+            timer.run("announcement", self.dispatcher.send(ANNOUNCEMENT_CHANNEL_ID, announcement)),
+        )
 
         await ctx.send(f"Application from User ID {user_id} has been accepted.", ephemeral=True)
+        logger.info("%s", timer.summary())
 
 
     @interactions.component_callback(re.compile(r'^deny_'))
     async def on_deny(self, ctx: ComponentContext):
+        await ctx.defer(ephemeral=True)
+        timer = StepTimer("Deny")
         user_id = ctx.custom_id.split('_')[1]
-        user = await self.bot.fetch_user(user_id)
         deny_timestamp = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
         admin_nickname = ctx.author.nick if ctx.author.nick else ctx.author.username
-        
-        # Update the status in the CSV to "Denied"
+
+        # Update the stored status to "Denied"
         self.update_application_status(user_id, "Denied")
 
+        user = await timer.run("fetch_user", self.bot.fetch_user(user_id))
+
         # Create an embed to post in the handler channel
         embed = Embed(
             title="Application Denied",
@@ -291,11 +299,6 @@ class ApplicationHandler(Extension):
             color=0xff0000
         )
 
-        # Post the embed in the handler channel
-        handler_channel = await self.bot.fetch_channel(APP_HANDLER_CHANNEL_ID)
-        await handler_channel.send(embeds=[embed])
-        
-        # Send a DM to the applicant
         dm_message = (
             f"Hello {user.username},\n\n"
             f"Thank you for your application to join Joint Task Force Heavy. After careful consideration, we regret to inform you that your application has been denied. "
@@ -303,12 +306,14 @@ class ApplicationHandler(Extension):
             f"Best regards,\n"
             f"Joint Task Force Heavy Leadership"
         )
-        try:
-            await user.send(dm_message)
-        except Exception as e:
-            await handler_channel.send(f"Failed to send DM to {user.username}: {e}")
+
+        await asyncio.gather(
+            timer.run("handler_post", self.dispatcher.send(APP_HANDLER_CHANNEL_ID, embeds=[embed])),
+            timer.run("dm", self.send_decision_dm(user, dm_message)),
+        )
 
         await ctx.send(f"Application from User ID {user_id} has been denied.", ephemeral=True)
+        logger.info("%s", timer.summary())
 
     @interactions.component_callback("cancel")
     async def on_cancel(self, ctx: ComponentContext):
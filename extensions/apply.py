@@ -1,8 +1,6 @@
-import csv
-import json
 import asyncio
-import re
 import os
+import re
 from datetime import datetime
 import interactions
 from interactions import (
@@ -17,33 +15,70 @@ from interactions import (
     ButtonStyle,
     listen,
 )
+from src import logutil
+from src.appstore import APPLICATION_FIELDS, get_store
+from src.configcache import application_config
+from src.events import ApplicationSubmitted
+from src.sessions import SessionStore
+
+logger = logutil.init_logger(os.path.basename(__file__))
 
-# Load the application configuration from JSON
-with open('application.json', 'r') as file:
-    config = json.load(file)
+# Only DMs are read, and DM content doesn't need the privileged MESSAGE_CONTENT intent
+INTENTS = interactions.Intents.DIRECT_MESSAGES
 
-# Define constants
-CSV_FILE = 'applications.csv'
+SESSION_IDLE_TIMEOUT = 60 * 60  # seconds without an answer before an application is dropped
+EVICTION_INTERVAL = 5 * 60
 
 class ApplicationBot(Extension):
     def __init__(self, bot):
         self.bot = bot
-        self.applications = {}
+        self.applications = SessionStore(idle_timeout=SESSION_IDLE_TIMEOUT)
+        # Slash contexts can't be saved and their tokens expire anyway, so they only live in memory
+        self.slash_contexts = {}
+        self.eviction_task = None
+
+    def drop(self):
+        if self.eviction_task:
+            self.eviction_task.cancel()
+        super().drop()
 
     @listen(interactions.events.Ready)
     async def on_ready(self):
-        print(f'Logged in as {self.bot.user.username}')
+        logger.info("Logged in as %s", self.bot.user.username)
+        logger.info("Resuming %d saved application sessions", len(self.applications.sessions))
+        if self.eviction_task is None:
+            self.eviction_task = asyncio.create_task(self.evict_sessions())
+
+    async def evict_sessions(self):
+        while True:
+            await asyncio.sleep(EVICTION_INTERVAL)
+            for user_id in self.applications.evict_idle():
+                self.slash_contexts.pop(user_id, None)
+            stats = self.applications.stats()
+            logger.debug("Application sessions: %d active, %d evicted", stats["active"], stats["evicted"])
+
+    def get_session(self, user_id):
+        session = self.applications.get(user_id)
+        if session is None:
+            self.slash_contexts.pop(user_id, None)
+        return session
+
+    async def get_dm_channel(self, session):
+        return await self.bot.fetch_channel(session.dm_channel_id)
+
+    def finish_session(self, user_id):
+        self.applications.remove(user_id)
+        return self.slash_contexts.pop(user_id, None)
 
     @listen(interactions.events.MessageCreate)
     async def on_message_create(self, event):
         message = event.message
         user_id = message.author.id
-        if user_id in self.applications:
-            application = self.applications[user_id]
-            dm_channel = application["dm_channel"]
-            if message.channel.id == dm_channel.id:
-                application["answers"].append(message.content)
-                await self.handle_next_question_dm(user_id)
+        session = self.get_session(user_id)
+        if session and message.channel.id == session.dm_channel_id:
+            session.answers.append(message.content)
+            self.applications.touch(session)
+            await self.handle_next_question_dm(user_id)
 
     @interactions.slash_command(
         name="apply",
@@ -56,11 +91,11 @@ class ApplicationBot(Extension):
 
         user = ctx.author
         dm_channel = await user.fetch_dm()
-        await dm_channel.send(config["messages"]["initial_message"])
+        await dm_channel.send(application_config()["messages"]["initial_message"])
         await asyncio.sleep(5)  # Wait for the user to read the initial message
 
         # Fetch recruiting squadrons
-        recruiting_squadrons = [squadron["name"] for squadron in config["squadron_roles"].values() if squadron["recruiting"]]
+        recruiting_squadrons = [squadron["name"] for squadron in application_config()["squadron_roles"].values() if squadron["recruiting"]]
 
         # Create the dropdown menu for squadron selection
         squadron_select = StringSelectMenu(
@@ -74,58 +109,60 @@ class ApplicationBot(Extension):
             "Which Squadron are you applying to join?",
             components=[ActionRow(squadron_select), ActionRow(Button(style=ButtonStyle.SUCCESS, label="Next", custom_id="next_button"))]
         )
-        self.applications[user.id] = {
-            "dm_channel": dm_channel,
-            "answers": [],
-            "current_selection": None,
-            "slash_ctx": ctx,
-            "username": user.username,
-            "start_time": datetime.utcnow()  # Track start time
-        }
+        self.applications.start(user.id, user.username, dm_channel.id)
+        self.slash_contexts[user.id] = ctx
 
     @interactions.component_callback("squadron_select")
     async def squadron_select_callback(self, ctx: ComponentContext):
-        user_id = ctx.author.id
-        self.applications[user_id]["current_selection"] = ctx.values[0]
+        await self.select_option(ctx)
+
+    async def select_option(self, ctx):
+        session = self.get_session(ctx.author.id)
+        if session:
+            session.current_selection = ctx.values[0]
+            self.applications.touch(session)
         await ctx.defer(edit_origin=True)  # Acknowledge the interaction without deleting the message
 
     @interactions.component_callback("next_button")
     async def next_button_callback(self, ctx: ComponentContext):
         user_id = ctx.author.id
-        application = self.applications.get(user_id)
-        if application and application["current_selection"] is not None:
-            application["answers"].append(application["current_selection"])
-            application["current_selection"] = None
+        session = self.get_session(user_id)
+        if session and session.current_selection is not None:
+            session.answers.append(session.current_selection)
+            session.current_selection = None
+            self.applications.touch(session)
         await ctx.defer(edit_origin=True)  # Defer the interaction
         await self.handle_next_question(ctx)
 
     async def handle_next_question(self, ctx):
         user_id = ctx.author.id
-        application = self.applications.get(user_id)
-        if not application or len(application["answers"]) == 0:
+        session = self.get_session(user_id)
+        if not session or len(session.answers) == 0:
             await ctx.send("Please select a squadron first.", ephemeral=True)
             return
 
-        answers = application["answers"]
+        answers = session.answers
         current_question_index = len(answers)
 
-        if current_question_index < len(config["application_questions"]):
-            question = config["application_questions"][current_question_index]
+        questions = application_config()["application_questions"]
+        if current_question_index < len(questions):
+            dm_channel = await self.get_dm_channel(session)
+            question = questions[current_question_index]
             if question["response_type"] == "dropdown":
-                await self.handle_dropdown_question(application["dm_channel"], question, current_question_index)
+                await self.handle_dropdown_question(dm_channel, question, current_question_index)
             elif question["response_type"] == "yes/no":
-                await self.handle_yes_no_question(application["dm_channel"], question, current_question_index)
+                await self.handle_yes_no_question(dm_channel, question, current_question_index)
             else:
-                await self.handle_text_question(application["dm_channel"], question)
+                await self.handle_text_question(dm_channel, question)
         else:
-            self.save_application(user_id, answers, application["username"], application["start_time"])
+            await self.save_application(user_id, answers, session.username, session.started)
             await ctx.send('Thank you for your application! The admin team will review your answers and get back to you soon.', ephemeral=True)
-            slash_ctx = application.get("slash_ctx")
+            slash_ctx = self.finish_session(user_id)
             if slash_ctx:
                 try:
                     await slash_ctx.send("Application completed.", ephemeral=True)  # Complete the original slash command
                 except Exception as e:
-                    print(f"Error sending completion message: {e}")
+                    logger.warning("Error sending completion message: %s", e)
 
     async def handle_dropdown_question(self, dm_channel, question, index):
         select_options = [StringSelectOption(label=opt, value=opt) for opt in question["options"]]
@@ -153,87 +190,72 @@ class ApplicationBot(Extension):
         )
 
     async def handle_next_question_dm(self, user_id):
-        application = self.applications.get(user_id)
-        if not application:
-            await application["dm_channel"].send("An error occurred. Please restart the application process.")
+        session = self.get_session(user_id)
+        if not session:
             return
 
-        answers = application["answers"]
+        answers = session.answers
         current_question_index = len(answers)
+        dm_channel = await self.get_dm_channel(session)
 
-        if current_question_index < len(config["application_questions"]):
-            question = config["application_questions"][current_question_index]
+        questions = application_config()["application_questions"]
+        if current_question_index < len(questions):
+            question = questions[current_question_index]
             if question["response_type"] == "dropdown":
-                await self.handle_dropdown_question(application["dm_channel"], question, current_question_index)
+                await self.handle_dropdown_question(dm_channel, question, current_question_index)
             elif question["response_type"] == "yes/no":
-                await self.handle_yes_no_question(application["dm_channel"], question, current_question_index)
+                await self.handle_yes_no_question(dm_channel, question, current_question_index)
             else:
-                await self.handle_text_question(application["dm_channel"], question)
+                await self.handle_text_question(dm_channel, question)
         else:
-            self.save_application(user_id, answers, application["username"])
-            await application["dm_channel"].send('Thank you for your application! The admin team will review your answers and get back to you soon.')
-            slash_ctx = application.get("slash_ctx")
+            await self.save_application(user_id, answers, session.username, session.started)
+            await dm_channel.send('Thank you for your application! The admin team will review your answers and get back to you soon.')
+            slash_ctx = self.finish_session(user_id)
             if slash_ctx:
                 try:
                     await slash_ctx.send("Application completed.", ephemeral=True)  # Complete the original slash command
                 except Exception as e:
-                    print(f"Error sending completion message: {e}")
+                    logger.warning("Error sending completion message: %s", e)
 
-    def save_application(self, user_id, answers, username, start_time):
+    async def save_application(self, user_id, answers, username, start_time):
         end_time = datetime.utcnow()
-        duration = (end_time - start_time).total_seconds()
-
-        # Ensure the CSV file has headers
-        file_exists = os.path.isfile(CSV_FILE)
-        with open(CSV_FILE, 'a', newline='') as csvfile:
-            writer = csv.writer(csvfile)
-            headers = [
-                "Username", 
-                "Which Squadron are you applying to join?", 
-                "Requested Callsign", 
-                "Are you a member of another DCS Squadron?", 
-                "What style of play are you into when playing DCS?", 
-                "Are you already an accepted member of HVY?", 
-                "Are you a former member of Joint Task Force Heavy?", 
-                "Are you over the age of 18?", 
-                "Discord Username",
-                "User ID", 
-                "Status", 
-                "Timestamp", 
-                "Duration"
-            ]
-            if not file_exists:
-                writer.writerow(headers)
-
-            # Programmatically add Discord Username to the answers
-            discord_username = self.bot.get_user(user_id).username
-            answers.insert(7, discord_username)  # Insert at the correct position
-
-            # Ensure the order of answers matches the headers
-            row = [username] + answers + [str(user_id), "Pending (No Post)", end_time.isoformat(), duration]
-            writer.writerow(row)
+        duration = (end_time - datetime.utcfromtimestamp(start_time)).total_seconds()
+
+        # Programmatically add Discord Username to the answers
+        # The user cache may be capped (COMPACT_MEMBER_CACHE), so fall back to REST
+        user = self.bot.get_user(user_id) or await self.bot.fetch_user(user_id)
+        discord_username = user.username
+        answers.insert(7, discord_username)  # Insert at the correct position
+
+        # Ensure the order of answers matches the stored fields
+        row = [username] + answers + [str(user_id), "Pending (No Post)", end_time.isoformat(), duration]
+        application = dict(zip(APPLICATION_FIELDS, row))
+        get_store().add(application)
+
+        # The stored "Pending (No Post)" status doubles as the outbox, so the
+        # handler can still pick this up after a restart if the event is lost
+        self.bot.dispatch(ApplicationSubmitted(application))
 
     @interactions.component_callback(re.compile(r'^dropdown_'))
     async def dropdown_callback(self, ctx: ComponentContext):
-        user_id = ctx.author.id
-        self.applications[user_id]["current_selection"] = ctx.values[0]
-        await ctx.defer(edit_origin=True)  # Acknowledge the interaction without deleting the message
+        await self.select_option(ctx)
+
+    async def answer_yes_no(self, ctx, answer):
+        session = self.get_session(ctx.author.id)
+        if session:
+            session.answers.append(answer)
+            self.applications.touch(session)
+            if len(session.answers) < len(application_config()["application_questions"]):
+                await ctx.defer(edit_origin=True)  # Defer the interaction if not the last question
+        await self.handle_next_question(ctx)
 
     @interactions.component_callback(re.compile(r'^yes_'))
     async def yes_button_callback(self, ctx: ComponentContext):
-        user_id = ctx.author.id
-        self.applications[user_id]["answers"].append("Yes")
-        if len(self.applications[user_id]["answers"]) < len(config["application_questions"]):
-            await ctx.defer(edit_origin=True)  # Defer the interaction if not the last question
-        await self.handle_next_question(ctx)
+        await self.answer_yes_no(ctx, "Yes")
 
     @interactions.component_callback(re.compile(r'^no_'))
     async def no_button_callback(self, ctx: ComponentContext):
-        user_id = ctx.author.id
-        self.applications[user_id]["answers"].append("No")
-        if len(self.applications[user_id]["answers"]) < len(config["application_questions"]):
-            await ctx.defer(edit_origin=True)  # Defer the interaction if not the last question
-        await self.handle_next_question(ctx)
+        await self.answer_yes_no(ctx, "No")
 
 def setup(bot):
     ApplicationBot(bot)
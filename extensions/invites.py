@@ -1,83 +1,260 @@
 import os
 import json
+import asyncio
+import time
+from typing import NamedTuple, Optional
 import interactions
 from interactions import listen
-from interactions.api.events import Ready, GuildJoin, MemberAdd
+from interactions.api.events import Ready, GuildJoin, MemberAdd, InviteCreate, InviteDelete
 from config import DEV_GUILD
 from src import logutil
+from src.jsonlog import RotatingJsonLog
+from src.dispatcher import PRIORITY_LOG, get_dispatcher
+from src.invitestats import InviteStats
+from src.persist import DebouncedWriter, write_json_atomic
 
 logger = logutil.init_logger(os.path.basename(__file__))
 
-INVITE_LOG_FILE = 'invite_log.json'
+INTENTS = interactions.Intents.GUILDS | interactions.Intents.GUILD_MEMBERS | interactions.Intents.GUILD_INVITES
+
+INVITE_LOG_FILE = 'invite_log.jsonl'
+LEGACY_INVITE_LOG_FILE = 'invite_log.json'
+INVITE_STATS_FILE = 'invite_stats.json'
+STATS_PAGE_SIZE = 10
 BOT_CHANNEL_ID = 401633673524543488
+JOIN_BATCH_WINDOW = 3  # seconds to collect joins before matching them against one invite fetch
+WARMUP_CONCURRENCY = 4  # guilds whose invites are fetched at once on Ready
+DELETED_INVITE_TTL = 60  # seconds a deleted invite is kept around to attribute a join that used it up
+
+
+class InviteUses(NamedTuple):
+    uses: int
+    max_uses: int
+    inviter_id: Optional[int]
+    expires: Optional[float]  # Unix timestamp, None if the invite never expires
+
+    @classmethod
+    def from_invite(cls, invite):
+        return cls(
+            invite.uses or 0,
+            invite.max_uses or 0,
+            int(invite._inviter_id) if invite._inviter_id else None,
+            cls.expiry(invite),
+        )
+
+    @staticmethod
+    def expiry(invite):
+        if invite.expires_at:
+            return invite.expires_at.timestamp()
+        # INVITE_CREATE payloads have no expires_at, only when they were created and for how long
+        if invite.max_age and invite.created_at:
+            return invite.created_at.timestamp() + invite.max_age
+        return None
+
 
 class InviteTracker(interactions.Extension):
     def __init__(self, bot):
         self.bot = bot
         logger.debug("Initializing InviteTracker extension...")
         
-        # Load or initialize invite log
-        if os.path.exists(INVITE_LOG_FILE):
-            with open(INVITE_LOG_FILE, 'r') as f:
-                self.invite_log = json.load(f)
-        else:
-            self.invite_log = []
-
-        self.bot.invites = {}
+        # One-off migration of the old single JSON array log
+        if os.path.exists(LEGACY_INVITE_LOG_FILE) and not os.path.exists(INVITE_LOG_FILE):
+            with open(LEGACY_INVITE_LOG_FILE, 'r') as f:
+                legacy_log = json.load(f)
+            with open(INVITE_LOG_FILE, 'w') as f:
+                for entry in legacy_log:
+                    f.write(json.dumps(entry, separators=(',', ':')) + "\n")
+            os.replace(LEGACY_INVITE_LOG_FILE, f"{LEGACY_INVITE_LOG_FILE}.bak")
+            logger.info("Migrated %s invite log entries to %s", len(legacy_log), INVITE_LOG_FILE)
+
+        self.invite_log = RotatingJsonLog(INVITE_LOG_FILE)
+        self.stats = self.load_stats()
+        self.stats_writer = DebouncedWriter(INVITE_STATS_FILE, self.stats.to_json)
+
+        self.bot.invites = {}  # guild id -> {code: InviteUses}
+        self.deleted_invites = {}  # guild id -> {code: (InviteUses, deleted at)}
+        self.pending_joins = {}  # guild id -> members waiting to be attributed
+        self.join_batches = {}  # guild id -> batch task still collecting joins
+        self.batch_tasks = set()  # every unfinished batch task, asyncio only keeps weak references
         logger.debug("InviteTracker extension initialized.")
 
+    def load_stats(self):
+        """Saved aggregates caught up with the log, or a rebuild from the log if they are missing.
+        The log only retains recent history, so saved counters are never thrown away"""
+        stats = None
+        if os.path.exists(INVITE_STATS_FILE):
+            try:
+                with open(INVITE_STATS_FILE, 'r') as f:
+                    stats = InviteStats.from_json(json.load(f))
+            except (OSError, ValueError, KeyError):
+                logger.exception("Failed to load %s, rebuilding...", INVITE_STATS_FILE)
+
+        if stats is not None:
+            newest = self.invite_log.last(1)
+            if stats.last != (newest[0] if newest else None):
+                # Joins logged after the last save, e.g. when the bot stopped before the write
+                missed = self.invite_log.since(stats.last)
+                if missed is None:
+                    logger.warning("Last counted invite not found in the invite log, keeping the saved stats")
+                else:
+                    for entry in missed:
+                        stats.add(entry)
+                    write_json_atomic(INVITE_STATS_FILE, stats.to_json())
+                    logger.info("Caught invite stats up with %d log entries", len(missed))
+            return stats
+
+        stats = InviteStats.rebuild(self.invite_log)
+        write_json_atomic(INVITE_STATS_FILE, stats.to_json())
+        logger.info("Rebuilt invite stats from %d log entries", stats.total)
+        return stats
+
+    def drop(self):
+        self.stats_writer.flush_soon()
+        super().drop()
+
+    async def refresh_invites(self, guild):
+        """Replace the cached uses table of a guild with a fresh fetch, returns the fetched invites"""
+        invites = await guild.fetch_invites()
+        self.bot.invites[guild.id] = {invite.code: InviteUses.from_invite(invite) for invite in invites}
+        return invites
+
     @listen(Ready)
     async def on_ready(self, event: Ready):
         logger.debug("Bot is ready, fetching invites...")
-        for guild in self.bot.guilds:
-            invites = await guild.fetch_invites()
-            self.bot.invites[guild.id] = {invite.code: invite for invite in invites}
-        with open(INVITE_LOG_FILE, 'w') as f:
-            json.dump(self.invite_log, f, indent=4)
-        logger.debug("Invites fetched and stored.")
+        semaphore = asyncio.Semaphore(WARMUP_CONCURRENCY)
+
+        async def warm(guild):
+            async with semaphore:
+                try:
+                    await self.refresh_invites(guild)
+                except Exception:
+                    logger.exception("Failed to fetch invites for guild %s", guild.id)
+
+        await asyncio.gather(*(warm(guild) for guild in self.bot.guilds))
+        logger.debug("Invites fetched and stored for %d guilds.", len(self.bot.invites))
 
     @listen(GuildJoin)
     async def on_guild_join(self, event: GuildJoin):
         guild = event.guild
-        logger.debug(f"Joined guild: {guild.name}")
+        logger.debug("Joined guild: %s", guild.name)
 
-        invites = await guild.fetch_invites()
-        self.bot.invites[guild.id] = {invite.code: invite for invite in invites}
+        # GuildJoin also fires for every guild while connecting; those are covered by the Ready warmup
+        if self.bot.is_ready and guild.id not in self.bot.invites:
+            await self.refresh_invites(guild)
+
+    @listen(InviteCreate)
+    async def on_invite_create(self, event: InviteCreate):
+        invite = event.invite
+        if invite._guild_id is None:
+            return
+        self.bot.invites.setdefault(int(invite._guild_id), {})[invite.code] = InviteUses.from_invite(invite)
+
+    @listen(InviteDelete)
+    async def on_invite_delete(self, event: InviteDelete):
+        invite = event.invite
+        if invite._guild_id is None:
+            return
+        guild_id = int(invite._guild_id)
+        uses = self.bot.invites.get(guild_id, {}).pop(invite.code, None)
+        if uses is None:
+            return
+
+        # Discord deletes an invite on its last use, usually before the join batch looks at it
+        now = time.time()
+        deleted = self.deleted_invites.setdefault(guild_id, {})
+        deleted[invite.code] = (uses, now)
+        for code in [code for code, (_, at) in deleted.items() if at < now - DELETED_INVITE_TTL]:
+            del deleted[code]
 
     @listen(MemberAdd)
     async def on_guild_member_add(self, event: MemberAdd):
         member = event.member
         logger.debug("Member joined: %s", member.user.username)
         guild_id = member.guild.id
-        invites_before_join = self.bot.invites.get(guild_id, {})
-        invites_after_join = await member.guild.fetch_invites()
 
-        for invite in invites_after_join:
-            if invite.uses > invites_before_join.get(invite.code, invite).uses:
-                await self.log_invite(invite, member)
-                self.bot.invites[guild_id] = {invite.code: invite for invite in invites_after_join}
+        # Joins are batched so a burst costs one invite fetch instead of one per member
+        self.pending_joins.setdefault(guild_id, []).append(member)
+        if guild_id not in self.join_batches:
+            task = self.join_batches[guild_id] = asyncio.create_task(self.process_joins(member.guild))
+            self.batch_tasks.add(task)
+            task.add_done_callback(self.batch_tasks.discard)
+
+    async def process_joins(self, guild):
+        try:
+            await asyncio.sleep(JOIN_BATCH_WINDOW)
+        finally:
+            # Joins arriving from here on start a new batch
+            self.join_batches.pop(guild.id, None)
+        members = self.pending_joins.pop(guild.id, [])
+        if not members:
+            return
+
+        try:
+            await self.attribute_joins(guild, members)
+        except Exception:
+            # Nobody awaits the batch task, so this is the only trace of the lost joins
+            logger.exception("Failed to attribute %d joins in guild %s", len(members), guild.id)
+
+    async def attribute_joins(self, guild, members):
+        invites_before_join = dict(self.bot.invites.get(guild.id, {}))
+        # Only invites deleted recently can have been used up by this batch
+        now = time.time()
+        for code, (uses, deleted_at) in self.deleted_invites.pop(guild.id, {}).items():
+            if deleted_at >= now - DELETED_INVITE_TTL:
+                invites_before_join.setdefault(code, uses)
+        await self.refresh_invites(guild)
+        invites_after_join = self.bot.invites[guild.id]
+
+        # Every use counted since the last fetch is a slot a batched join can be attributed to
+        slots = []
+        for code, after in invites_after_join.items():
+            before = invites_before_join.get(code)
+            delta = after.uses - (before.uses if before else 0)
+            slots.extend([(code, after.inviter_id)] * max(delta, 0))
+
+        # Limited invites that vanished without expiring may have been used up, but they only
+        # account for joins the counted uses can't explain (vanity or discovery joins have no slot)
+        now = time.time()
+        for code, before in invites_before_join.items():
+            unattributed = len(members) - len(slots)
+            if unattributed <= 0:
                 break
+            expired = before.expires is not None and before.expires <= now
+            if code not in invites_after_join and not expired and before.max_uses and before.uses < before.max_uses:
+                slots.extend([(code, before.inviter_id)] * min(before.max_uses - before.uses, unattributed))
+
+        for member, (code, inviter_id) in zip(members, slots):
+            await self.log_invite(code, inviter_id, member)
+        for member in members[len(slots):]:
+            logger.debug("Could not attribute join of %s to an invite", member.user.username)
 
-    async def log_invite(self, invite, member):
+    async def get_username(self, user_id):
+        if user_id is None:
+            return "Unknown"
+        user = self.bot.get_user(user_id) or await self.bot.fetch_user(user_id)
+        return user.username if user else "Unknown"
+
+    async def log_invite(self, code, inviter_id, member):
+        referrer = await self.get_username(inviter_id)
         entry = {
-            "code": invite.code,
-            "referrer": invite.inviter.username,
+            "code": code,
+            "referrer": referrer,
             "user": member.user.username,
             "timestamp": member.joined_at.isoformat() if member.joined_at else 'N/A'
         }
         self.invite_log.append(entry)
+        self.stats.add(entry)
+        self.stats_writer.schedule()
 
-        with open(INVITE_LOG_FILE, 'w') as f:
-            json.dump(self.invite_log, f, indent=4)
-        
-        # Send message to the bot channel
-        bot_channel = await self.bot.fetch_channel(BOT_CHANNEL_ID)
-        if bot_channel:
-            await bot_channel.send(
-                f"New member joined: {member.user.username}\n"
-                f"Invite code: {invite.code}\n"
-                f"Invited by: {invite.inviter.username}"
-            )
+        # Join logs are low priority and merged into digests under bursts
+        get_dispatcher(self.bot).send(
+            BOT_CHANNEL_ID,
+            f"New member joined: {member.user.username}\n"
+            f"Invite code: {code}\n"
+            f"Invited by: {referrer}",
+            priority=PRIORITY_LOG,
+            digest=True,
+        )
 
     @interactions.slash_command(
         name="invitelog",
@@ -86,12 +263,13 @@ class InviteTracker(interactions.Extension):
     )
     async def invitelog_command(self, ctx: interactions.SlashContext):
         logger.debug("invitelog command invoked.")
-        if not self.invite_log:
+        entries = self.invite_log.last(10)
+        if not entries:
             await ctx.send("No invite logs found.")
             return
         
         messages = [f"**Invite Log:**"]
-        for entry in self.invite_log[-10:]:
+        for entry in entries:
             messages.append(f"Code: {entry['code']}\n"
                             f"Referrer: {entry['referrer']}\n"
                             f"User: {entry['user']}\n"
@@ -99,6 +277,46 @@ class InviteTracker(interactions.Extension):
         
         await ctx.send('\n'.join(messages))
 
+    @interactions.slash_command(
+        name="invitestats",
+        description="Top referrers, joins per invite code and joins per week",
+        scopes=[DEV_GUILD] if DEV_GUILD else None
+    )
+    @interactions.slash_option(
+        name="view",
+        description="Which breakdown to show",
+        opt_type=interactions.OptionType.STRING,
+        required=False,
+        choices=[
+            interactions.SlashCommandChoice(name="referrers", value="referrers"),
+            interactions.SlashCommandChoice(name="codes", value="codes"),
+            interactions.SlashCommandChoice(name="weeks", value="weeks"),
+        ]
+    )
+    @interactions.slash_option(
+        name="page",
+        description="Page number (default: 1)",
+        opt_type=interactions.OptionType.INTEGER,
+        required=False
+    )
+    async def invitestats_command(self, ctx: interactions.SlashContext, view: str = "referrers", page: int = 1):
+        logger.debug("invitestats command invoked.")
+        if not self.stats.total:
+            await ctx.send("No invite logs found.")
+            return
+
+        rows, page, pages = self.stats.page(view, page, STATS_PAGE_SIZE)
+        titles = {"referrers": "Top Referrers", "codes": "Joins per Invite Code", "weeks": "Joins per Week"}
+        start = (page - 1) * STATS_PAGE_SIZE
+        lines = [f"{start + i}. {name}: {count}" for i, (name, count) in enumerate(rows, 1)]
+
+        embed = interactions.Embed(
+            title=titles[view],
+            description="\n".join(lines),
+        )
+        embed.set_footer(text=f"Page {page}/{pages} - {self.stats.total} joins logged")
+        await ctx.send(embeds=[embed])
+
 def setup(bot):
     logger.debug("Setting up InviteTracker extension...")
     InviteTracker(bot)
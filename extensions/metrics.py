@@ -0,0 +1,112 @@
+import asyncio
+import os
+import time
+import interactions
+from aiohttp import web
+from interactions import listen
+from interactions.api.events import CommandCompletion, ComponentCompletion, Startup
+from interactions.client.errors import HTTPException
+from config import METRICS_PORT
+from src import logutil
+from src.metrics import get_metrics
+
+logger = logutil.init_logger(os.path.basename(__file__))
+
+INTENTS = interactions.Intents.GUILDS
+
+INTERACTION_TTL = 15 * 60  # interactions can't be answered after this, so their start time is dropped
+
+
+class MetricsCollector(interactions.Extension):
+    def __init__(self, bot):
+        self.bot = bot
+        logger.debug("Initializing MetricsCollector extension...")
+        self.metrics = get_metrics()
+        self.runner = None
+        self.interactions_received = {}  # interaction id -> perf_counter() when it arrived, oldest first
+
+        # Count gateway events and library REST calls at the source
+        self.original_dispatch = bot.dispatch
+        self.original_request = bot.http.request
+        bot.dispatch = self.counting_dispatch
+        bot.http.request = self.counting_request
+
+        logger.debug("MetricsCollector extension initialized.")
+
+    def drop(self):
+        self.bot.dispatch = self.original_dispatch
+        self.bot.http.request = self.original_request
+        if self.metrics.lag_task:
+            self.metrics.lag_task.cancel()
+        if self.runner:
+            asyncio.create_task(self.runner.cleanup())
+        super().drop()
+
+    def counting_dispatch(self, event, *args, **kwargs):
+        name = event.resolved_name
+        # Every gateway event is also dispatched as raw_<type>
+        if name.startswith("raw_") and name != "raw_gateway_event":
+            self.metrics.gateway_event(name[4:].upper())
+            if name == "raw_interaction_create":
+                self.interaction_received(int(event.data["id"]))
+        return self.original_dispatch(event, *args, **kwargs)
+
+    def interaction_received(self, interaction_id):
+        now = time.perf_counter()
+        received = self.interactions_received
+        # Insertion order is arrival order, so interactions that never completed are at the front
+        while received and next(iter(received.values())) < now - INTERACTION_TTL:
+            del received[next(iter(received))]
+        received[interaction_id] = now
+
+    def interaction_latency(self, ctx):
+        """Seconds from the interaction reaching the bot to its callback finishing, or None"""
+        received = self.interactions_received.pop(int(ctx.id), None)
+        return None if received is None else time.perf_counter() - received
+
+    async def counting_request(self, route, *args, **kwargs):
+        key = f"{route.method} {route.path}"
+        try:
+            result = await self.original_request(route, *args, **kwargs)
+        except HTTPException as e:
+            self.metrics.rest_call(key, e.status)
+            raise
+        except Exception:
+            self.metrics.rest_call(key, 0)
+            raise
+        self.metrics.rest_call(key, 200)
+        return result
+
+    @listen(Startup)
+    async def on_startup(self, event: Startup):
+        self.metrics.start_loop_monitor()
+        if METRICS_PORT:
+            await self.start_endpoint()
+
+    async def start_endpoint(self):
+        app = web.Application()
+        app.router.add_get("/metrics", self.metrics_endpoint)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, "127.0.0.1", METRICS_PORT).start()
+        logger.info("Serving metrics on http://127.0.0.1:%s/metrics", METRICS_PORT)
+
+    async def metrics_endpoint(self, request):
+        return web.Response(text=self.metrics.prometheus(), content_type="text/plain", charset="utf-8")
+
+    @listen(CommandCompletion)
+    async def on_command_completion(self, event: CommandCompletion):
+        latency = self.interaction_latency(event.ctx)
+        if latency is not None:
+            self.metrics.observe_command(event.ctx.invoke_target, latency)
+
+    @listen(ComponentCompletion)
+    async def on_component_completion(self, event: ComponentCompletion):
+        latency = self.interaction_latency(event.ctx)
+        if latency is not None:
+            self.metrics.observe_component(event.ctx.custom_id, latency)
+
+def setup(bot):
+    logger.debug("Setting up MetricsCollector extension...")
+    MetricsCollector(bot)
+    logger.debug("MetricsCollector extension setup complete")
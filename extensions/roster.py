@@ -1,84 +1,211 @@
+import asyncio
+import io
 import os
+import tempfile
+from datetime import datetime, timedelta, timezone
 import interactions
 import xlsxwriter
-import json
+from interactions import listen
+from interactions.api.events import Ready
 from config import DEV_GUILD
 from src import logutil
+from src.embeds import build_embeds, chunk_lines, group_for_messages
+from src.snapshots import SnapshotStore
+from src.squadrons import UNASSIGNED
 
 logger = logutil.init_logger(os.path.basename(__file__))
 
+INTENTS = interactions.Intents.GUILDS | interactions.Intents.GUILD_MEMBERS
+
+HEADERS = ['Nickname', 'Username', 'Roles', 'Joined At']
+SNAPSHOT_INTERVAL = timedelta(days=1)
+
+
+def sanitize_sheet_name(name):
+    # Replace invalid characters with underscores
+    return ''.join(['_' if c in '[]:*?/\\' else c for c in name])
+
+
+def build_workbook(sheets):
+    """Render [(sheet name, rows)] to xlsx bytes. Runs in a worker thread.
+
+    constant_memory streams each row to disk as it is written, which needs a
+    real file, so the workbook goes to a private temp file that is read back
+    and removed.
+    """
+    fd, path = tempfile.mkstemp(suffix='.xlsx')
+    os.close(fd)
+    try:
+        workbook = xlsxwriter.Workbook(path, {'constant_memory': True})
+        for name, rows in sheets:
+            sheet = workbook.add_worksheet(sanitize_sheet_name(name))
+            sheet.write_row(0, 0, HEADERS)
+            for row, data in enumerate(rows, start=1):
+                sheet.write_row(row, 0, data)
+        workbook.close()
+        with open(path, 'rb') as f:
+            return f.read()
+    finally:
+        os.remove(path)
+
+
 class Roster(interactions.Extension):
     def __init__(self, bot):
         self.bot = bot
         logger.debug("Initializing Roster extension...")
-        with open('sq_roles.json') as f:
-            self.squadron_roles = json.load(f)['squadron_roles']
+        self.snapshots = SnapshotStore()
+        self.snapshot_task = None
         logger.debug("Roster extension initialized.")
 
+    @listen(Ready)
+    async def on_ready(self, event: Ready):
+        if self.snapshot_task is None:
+            self.snapshot_task = asyncio.create_task(self.snapshot_loop())
+
+    def drop(self):
+        if self.snapshot_task:
+            self.snapshot_task.cancel()
+        super().drop()
+
     @interactions.slash_command(
         name="roster",
         description="Generate a roster",
         scopes=[DEV_GUILD] if DEV_GUILD else None
     )
-    async def roster_command(self, ctx: interactions.SlashContext):
+    @interactions.slash_option(
+        name="mode",
+        description="Full roster export, or only the changes between two dates",
+        opt_type=interactions.OptionType.STRING,
+        required=False,
+        choices=[
+            interactions.SlashCommandChoice(name="full", value="full"),
+            interactions.SlashCommandChoice(name="diff", value="diff"),
+        ]
+    )
+    @interactions.slash_option(
+        name="since",
+        description="Diff start date, YYYY-MM-DD (default: 7 days ago)",
+        opt_type=interactions.OptionType.STRING,
+        required=False
+    )
+    @interactions.slash_option(
+        name="until",
+        description="Diff end date, YYYY-MM-DD (default: latest snapshot)",
+        opt_type=interactions.OptionType.STRING,
+        required=False
+    )
+    async def roster_command(self, ctx: interactions.SlashContext, mode: str = "full", since: str = None, until: str = None):
         logger.debug("Roster command invoked.")
-        await self.create_roster(ctx)
+        await ctx.defer()
+        if mode == "diff":
+            await self.roster_diff(ctx, since, until)
+        else:
+            await self.create_roster(ctx)
+
+    def snapshot_state(self):
+        """member id -> (squadron, nick, role ids) for every indexed member"""
+        squadrons = self.bot.squadrons
+        state = {}
+        for guild in self.bot.guilds:
+            for member in squadrons.guild_members(guild):
+                state[member.id] = (
+                    squadrons.squadron_of(member.id) or UNASSIGNED,
+                    member.display_name,
+                    [role_id for role_id in member.role_ids if role_id != guild.id],
+                )
+        return state
+
+    async def take_snapshot(self):
+        squadrons = self.bot.squadrons
+        if not squadrons.ready:
+            await squadrons.build()
+        state = self.snapshot_state()
+        changes = await asyncio.to_thread(self.snapshots.record, state)
+        logger.info("Roster snapshot taken, %s members changed", changes)
+
+    async def snapshot_loop(self):
+        while True:
+            latest = self.snapshots.latest_date
+            now = datetime.now(timezone.utc)
+            if latest is None or now - latest >= SNAPSHOT_INTERVAL:
+                try:
+                    await self.take_snapshot()
+                except Exception:
+                    logger.exception("Failed to take roster snapshot")
+                latest = now
+            await asyncio.sleep(max(60, (latest + SNAPSHOT_INTERVAL - now).total_seconds()))
+
+    async def roster_diff(self, ctx: interactions.SlashContext, since: str, until: str):
+        try:
+            now = datetime.now(timezone.utc)
+            since_date = datetime.strptime(since, '%Y-%m-%d').replace(tzinfo=timezone.utc) if since else now - timedelta(days=7)
+            # An until date covers that whole day
+            until_date = datetime.strptime(until, '%Y-%m-%d').replace(tzinfo=timezone.utc) + timedelta(days=1) if until else now
+        except ValueError:
+            await ctx.send("Dates must be in YYYY-MM-DD format.")
+            return
 
-    def sanitize_sheet_name(self, name):
-        # Replace invalid characters with underscores
-        return ''.join(['_' if c in '[]:*?/\\' else c for c in name])
+        diff = await asyncio.to_thread(self.snapshots.diff, since_date, until_date)
+        if diff is None:
+            await ctx.send("No roster snapshots recorded yet.")
+            return
+
+        fields = []
+        sections = [
+            ("Joined", [f"{nick} ({squadron})" for squadron, nick, _ in diff["joined"]]),
+            ("Left", [f"{nick} ({squadron})" for squadron, nick, _ in diff["left"]]),
+            ("Switched squadron", [f"{nick}: {old} -> {new}" for nick, old, new in diff["moved"]]),
+            ("Renamed", [f"{old} -> {new}" for old, new in diff["renamed"]]),
+        ]
+        for title, lines in sections:
+            for i, chunk in enumerate(chunk_lines(sorted(lines))):
+                fields.append((f"{title} ({len(lines)})" if i == 0 else f"{title} (cont.)", chunk))
+
+        if not fields:
+            fields.append(("No changes", "Nobody joined, left, switched squadron or changed nickname."))
+
+        embeds = build_embeds(
+            "Roster changes",
+            fields,
+            description=f"From snapshot {diff['from']:%Y-%m-%d %H:%M} to {diff['to']:%Y-%m-%d %H:%M} UTC",
+            color=0x1a9ca8,
+        )
+        for batch in group_for_messages(embeds):
+            await ctx.send(embeds=batch)
+
+    def collect_rows(self, guild):
+        """Plain row data per squadron, gathered on the event loop from the member cache"""
+        squadrons = self.bot.squadrons
+        # Squadrons are already classified by the shared index, in sq_roles.json priority order
+        role_names = {int(role.id): role.name for role in guild.roles if role.name != "@everyone"}
+        sheets = []
+        for squadron_name in squadrons.squadron_names + [UNASSIGNED]:
+            rows = []
+            for member_id in squadrons.members_of(squadron_name):
+                member = squadrons.get_member(guild.id, member_id)
+                if member is None:
+                    continue
+                roles = [role_names[role_id] for role_id in member.role_ids if role_id in role_names]
+                rows.append([
+                    member.display_name,
+                    member.username,
+                    ', '.join(roles),
+                    member.joined_at.strftime('%Y-%m-%d %H:%M:%S') if member.joined_at else 'N/A',
+                ])
+            sheets.append((squadron_name, rows))
+        return sheets
 
     async def create_roster(self, ctx: interactions.SlashContext):
         logger.debug("Creating roster...")
-        guild = ctx.guild
-        members = guild.members
-
-        workbook = xlsxwriter.Workbook('roster.xlsx')
-        
-        # Sanitize sheet names and create sheets
-        sheets = {role: workbook.add_worksheet(self.sanitize_sheet_name(role)) for role in self.squadron_roles.values()}
-        sheets['Unassigned'] = workbook.add_worksheet('Unassigned')
-
-        # Headers for the sheets
-        headers = ['Nickname', 'Username', 'Roles', 'Joined At']
-        for sheet in sheets.values():
-            for col, header in enumerate(headers):
-                sheet.write(0, col, header)
-
-        rows = {role: 1 for role in self.squadron_roles.values()}
-        rows['Unassigned'] = 1
-
-        for member in members:
-            roles = [role.name for role in member.roles if role.name != "@everyone"]
-            role_ids = [role.id for role in member.roles if role.name != "@everyone"]
-            data = [
-                member.nick if member.nick else member.user.username,
-                member.user.username,
-                ', '.join(roles),
-                member.joined_at.strftime('%Y-%m-%d %H:%M:%S') if member.joined_at else 'N/A',
-            ]
-
-            sorted_flag = False
-            for role_id in role_ids:
-                squadron_name = self.squadron_roles.get(str(role_id))
-                if squadron_name:
-                    sheet = sheets[squadron_name]
-                    row = rows[squadron_name]
-                    for col, value in enumerate(data):
-                        sheet.write(row, col, value)
-                    rows[squadron_name] += 1
-                    sorted_flag = True
-                    break
-            if not sorted_flag:
-                sheet = sheets['Unassigned']
-                row = rows['Unassigned']
-                for col, value in enumerate(data):
-                    sheet.write(row, col, value)
-                rows['Unassigned'] += 1
+        squadrons = self.bot.squadrons
+        if not squadrons.ready:
+            await squadrons.build()
 
-        workbook.close()
-        await ctx.send(files=[interactions.File('roster.xlsx')])
-        os.remove('roster.xlsx')
+        sheets = self.collect_rows(ctx.guild)
+        # Building the workbook is CPU and disk bound, keep it off the event loop
+        data = await asyncio.to_thread(build_workbook, sheets)
+
+        await ctx.send(files=[interactions.File(io.BytesIO(data), file_name='roster.xlsx')])
         logger.debug("Roster created and file sent.")
 
 def setup(bot):
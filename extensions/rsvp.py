@@ -1,92 +1,136 @@
 import os
 import json
-import aiohttp
+import time
+import asyncio
 import interactions
 from interactions import listen, SlashContext, ComponentContext, StringSelectMenu, StringSelectOption
-from interactions.api.events import Ready, GuildScheduledEventCreate, GuildScheduledEventDelete, GuildScheduledEventUpdate
+from interactions.api.events import (
+    Ready,
+    GuildScheduledEventCreate,
+    GuildScheduledEventDelete,
+    GuildScheduledEventUpdate,
+    GuildScheduledEventUserAdd,
+    GuildScheduledEventUserRemove,
+)
 from config import DEV_GUILD
 from src import logutil
-from datetime import datetime, timezone
+from src.attendance import Attendance, AttendanceCache
+from src.embeds import build_embeds, chunk_lines, group_for_messages
+from src.eventindex import FINISHED_STATUSES, EventIndex, EventRecord
+from src.membercache import MemberRecord
+from src.persist import DebouncedWriter
+from src.restclient import RestClient, RestError
+from src.squadrons import UNASSIGNED
 
 logger = logutil.init_logger(os.path.basename(__file__))
 
+INTENTS = interactions.Intents.GUILDS | interactions.Intents.GUILD_MEMBERS | interactions.Intents.GUILD_SCHEDULED_EVENTS
+
 EVENTS_FILE = 'events.json'
+ATTENDANCE_TTL = 600  # seconds before cached attendance is refetched
+WARM_EVENTS = 3  # upcoming events whose attendance is kept warm
+WARM_INTERVAL = 300
 
 class RSVP(interactions.Extension):
     def __init__(self, bot):
         self.bot = bot
         self.bot_token = os.environ.get("TOKEN")
+        self.http = RestClient(self.bot_token)
         logger.debug("Initializing RSVP extension...")
 
-        # Load or initialize events list
+        # Load or initialize the event index
         if os.path.exists(EVENTS_FILE):
             with open(EVENTS_FILE, 'r') as f:
-                self.events = json.load(f)
+                self.events = EventIndex(EventRecord.from_json(event) for event in json.load(f))
         else:
-            self.events = []
+            self.events = EventIndex()
+        self.resync_task = None
+        self.events_writer = DebouncedWriter(EVENTS_FILE, self.events_snapshot)
 
-        # Load squadron roles
-        with open('sq_roles.json') as f:
-            self.squadron_roles = json.load(f)['squadron_roles']
+        # Sorted attendance per event, patched from RSVP add/remove events
+        self.attendance = AttendanceCache(ttl=ATTENDANCE_TTL)
+        self.attendance_loads = {}
+        self.warm_task = None
 
         logger.debug("RSVP extension initialized.")
 
+    def drop(self):
+        if self.warm_task:
+            self.warm_task.cancel()
+        self.events_writer.flush_soon()
+        asyncio.create_task(self.http.close())
+        super().drop()
+
     @listen(Ready)
     async def on_ready(self, event: Ready):
         logger.debug("Bot is ready, fetching events...")
         await self.fetch_all_events()
         logger.debug("Events fetched and stored.")
+        if self.warm_task is None:
+            self.warm_task = asyncio.create_task(self.warm_attendance())
 
     @listen(GuildScheduledEventCreate)
     async def on_guild_scheduled_event_create(self, event: GuildScheduledEventCreate):
-        logger.debug(f"New event created: {event.scheduled_event.name}")
-        await self.fetch_all_events()  # Fetch all events again
+        logger.debug("New event created: %s", event.scheduled_event.name)
+        self.events.upsert(EventRecord.from_event(event.scheduled_event))
+        self.save_events_to_file()
         logger.debug("Events updated and saved to file.")
 
     @listen(GuildScheduledEventDelete)
     async def on_guild_scheduled_event_delete(self, event: GuildScheduledEventDelete):
-        logger.debug(f"Event deleted: {event.scheduled_event.name}")
-        await self.fetch_all_events()  # Fetch all events again
+        logger.debug("Event deleted: %s", event.scheduled_event.name)
+        self.attendance.invalidate(event.scheduled_event.id)
+        if not self.events.remove(event.scheduled_event.id) and not self.has_started(event.scheduled_event):
+            self.schedule_resync(f"deleted event {event.scheduled_event.id} was not indexed")
+        self.save_events_to_file()
         logger.debug("Events updated and saved to file.")
 
     @listen(GuildScheduledEventUpdate)
     async def on_guild_scheduled_event_update(self, event: GuildScheduledEventUpdate):
-        logger.debug(f"Event updated: {event.after.name}")
-        await self.fetch_all_events()  # Fetch all events again
+        logger.debug("Event updated: %s", event.after.name)
+        self.attendance.invalidate(event.after.id)
+        if event.after.id not in self.events and event.after.status not in FINISHED_STATUSES and not self.has_started(event.after):
+            self.schedule_resync(f"updated event {event.after.id} was not indexed")
+        self.events.upsert(EventRecord.from_event(event.after))
+        self.save_events_to_file()
         logger.debug("Events updated and saved to file.")
 
+    @staticmethod
+    def has_started(scheduled_event):
+        # Started events are pruned from the index, so their updates aren't drift
+        return scheduled_event.start_time.timestamp() <= time.time()
+
+    def schedule_resync(self, reason):
+        # An event we never saw means a gateway payload was missed, rebuild from REST
+        if self.resync_task and not self.resync_task.done():
+            return
+        logger.warning("Scheduled events out of sync (%s), resyncing", reason)
+        self.resync_task = asyncio.create_task(self.fetch_all_events())
+
     def save_events_to_file(self):
-        now = datetime.now(timezone.utc)
-        unique_events = {}
-        for event in self.events:
-            event_time = datetime.strptime(event['scheduled_start_time'], '%Y-%m-%dT%H:%M:%S%z')
-            if event_time > now:
-                unique_events[event['id']] = event
-        self.events = list(unique_events.values())
+        # Written behind, so a burst of event changes costs one write
+        self.events_writer.schedule()
 
-        with open(EVENTS_FILE, 'w') as f:
-            json.dump(self.events, f, indent=4)
+    def events_snapshot(self):
+        self.events.prune()
+        return self.events.to_json()
 
     async def fetch_all_events(self):
-        self.events = []  # Clear current events to avoid duplicates
-        for guild in self.bot.guilds:
-            events = await self.fetch_events(guild.id)
-            self.events.extend(events)
+        guilds = list(self.bot.guilds)
+        results = await asyncio.gather(*[self.fetch_events(guild.id) for guild in guilds])
+        for guild, records in zip(guilds, results):
+            # Keep what we have for a guild whose fetch failed
+            if records is not None:
+                self.events.replace_guild(int(guild.id), records)
         self.save_events_to_file()
 
     async def fetch_events(self, guild_id):
-        url = f"https://discord.com/api/v10/guilds/{guild_id}/scheduled-events"
-        headers = {"Authorization": f"Bot {self.bot_token}"}
-
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, headers=headers) as response:
-                if response.status == 200:
-                    events = await response.json()
-                    events_sorted = sorted(events, key=lambda x: x["scheduled_start_time"])
-                    return events_sorted
-                else:
-                    logger.error(f"Failed to fetch events: {response.status}")
-                    return []
+        status, events = await self.http.get(f"/guilds/{guild_id}/scheduled-events")
+        if status == 200:
+            return [EventRecord.from_payload(event) for event in events]
+        else:
+            logger.error("Failed to fetch events: %s", status)
+            return None
 
     @interactions.slash_command(
         name="getpilots",
@@ -95,14 +139,13 @@ class RSVP(interactions.Extension):
     )
     async def getpilots_command(self, ctx: SlashContext):
         logger.debug("getpilots command invoked.")
-        if not self.events:
+        # Limit to the next 24 upcoming events
+        upcoming_events = self.events.upcoming(limit=24)
+        if not upcoming_events:
             await ctx.send("No events found.")
             return
 
-        # Limit to the next 24 upcoming events
-        upcoming_events = self.events[:24]
-
-        options = [StringSelectOption(label=event["name"][:25], value=str(event["id"])) for event in upcoming_events]
+        options = [StringSelectOption(label=event.name[:25], value=str(event.id)) for event in upcoming_events]
         select_menu = StringSelectMenu(
             *options,
             placeholder="Choose an event...",
@@ -122,84 +165,158 @@ class RSVP(interactions.Extension):
     async def sort_participants(self, ctx, event_id: str):
         guild_id = ctx.guild_id
 
-        event_details = await self.get_event_details(guild_id, event_id)
-        if not event_details:
-            await ctx.send("Failed to fetch event details.")
+        try:
+            attendance = await self.get_attendance(guild_id, event_id)
+        except RestError as e:
+            logger.error("Failed to fetch attendance: %s", e.status)
+            await ctx.send("No interested users found or unable to fetch data.")
             return
 
-        event_title = event_details.get("name", "Unknown Event")
-        event_date = event_details.get("scheduled_start_time", "Unknown Date")
+        if attendance is None:
+            await ctx.send("Failed to fetch event details.")
+            return
 
-        participants = await self.get_interested_people(guild_id, event_id)
-        if not participants:
+        if not attendance.attendees:
             await ctx.send("No interested users found or unable to fetch data.")
             return
 
-        squadrons = self.sort_into_squadrons(participants)
-
-        embed = interactions.Embed(
-            title=f"{event_title}",
-            description=f"Date: {event_date}",
-            color=0x1a9ca8
-        )
-        embed.set_author(name="Current Attendance")
-        embed.set_footer(text="Attendance sorted by squadron")
+        squadrons = attendance.squadrons(self.bot.squadrons.squadron_names)
 
+        # Large squadrons are split over several fields, and fields over several embeds/messages
+        fields = []
         for squadron, members in squadrons.items():
             if members:
-                member_list = "\n".join(members)
-                embed.add_field(name=f"{squadron} ({len(members)} currently attending):", value=member_list, inline=False)
-
-        await ctx.send(embeds=embed)
+                for i, member_list in enumerate(chunk_lines(members)):
+                    name = f"{squadron} ({len(members)} currently attending):" if i == 0 else f"{squadron} (cont.):"
+                    fields.append((name, member_list))
+
+        embeds = build_embeds(
+            attendance.title,
+            fields,
+            description=f"Date: {attendance.date}",
+            color=0x1a9ca8,
+            author="Current Attendance",
+            footer="Attendance sorted by squadron",
+        )
+        for batch in group_for_messages(embeds):
+            await ctx.send(embeds=batch)
+
+    async def get_attendance(self, guild_id, event_id):
+        """Cached attendance for an event, loading it if missing or expired.
+        Concurrent callers for the same event share one load"""
+        attendance = self.attendance.get(event_id)
+        if attendance is not None:
+            return attendance
+
+        event_id = int(event_id)
+        task = self.attendance_loads.get(event_id)
+        if task is None:
+            task = asyncio.ensure_future(self.load_attendance(guild_id, event_id))
+            self.attendance_loads[event_id] = task
+            task.add_done_callback(lambda _: self.attendance_loads.pop(event_id, None))
+        return await asyncio.shield(task)
+
+    async def load_attendance(self, guild_id, event_id):
+        # Title and date come from the event index when we have the event, otherwise from REST alongside the pages
+        record = self.events.get(event_id)
+        details_task = None if record else asyncio.ensure_future(self.get_event_details(guild_id, event_id))
+
+        attendees = {}
+        try:
+            async for page in self.iter_interested_pages(guild_id, event_id):
+                for user_id, nickname, role_ids in page:
+                    attendees[int(user_id)] = (nickname, self.classify(user_id, role_ids))
+        except RestError:
+            if details_task:
+                details_task.cancel()
+            raise
+
+        if record:
+            title, date = record.name, record.start_time.isoformat()
+        else:
+            event_details = await details_task
+            if not event_details:
+                return None
+            title = event_details.get("name", "Unknown Event")
+            date = event_details.get("scheduled_start_time", "Unknown Date")
+
+        attendance = Attendance(event_id, title, date, attendees)
+        self.attendance.put(attendance)
+        return attendance
+
+    def classify(self, user_id, role_ids):
+        # Indexed members are a lookup, anyone else is classified from the payload's roles
+        index = self.bot.squadrons
+        squadron = index.squadron_of(user_id) or index.classify(role_ids)
+        return None if squadron == UNASSIGNED else squadron
+
+    async def warm_attendance(self):
+        """Keep attendance for the next few events loaded in the background"""
+        while True:
+            for record in self.events.upcoming(limit=WARM_EVENTS):
+                if self.attendance.get(record.id) is None:
+                    try:
+                        await self.get_attendance(record.guild_id, record.id)
+                    except RestError as e:
+                        logger.warning("Failed to warm attendance for %s: %s", record.name, e.status)
+                    except Exception:
+                        logger.exception("Failed to warm attendance for %s", record.name)
+            await asyncio.sleep(WARM_INTERVAL)
+
+    @listen(GuildScheduledEventUserAdd)
+    async def on_guild_scheduled_event_user_add(self, event: GuildScheduledEventUserAdd):
+        if self.attendance.get(event.scheduled_event_id) is None:
+            return
+        squadrons = self.bot.squadrons
+        member = squadrons.get_member(event.guild_id, event.user_id)
+        if member is None:
+            fetched = await self.bot.fetch_member(event.user_id, event.guild_id)
+            if fetched is None:
+                self.attendance.invalidate(event.scheduled_event_id)
+                return
+            member = MemberRecord.from_member(fetched)
+        squadron = self.classify(member.id, member.role_ids)
+        self.attendance.add(event.scheduled_event_id, member.id, member.display_name, squadron)
+
+    @listen(GuildScheduledEventUserRemove)
+    async def on_guild_scheduled_event_user_remove(self, event: GuildScheduledEventUserRemove):
+        self.attendance.remove(event.scheduled_event_id, event.user_id)
 
     async def get_event_details(self, guild_id, event_id):
-        url = f"https://discord.com/api/v10/guilds/{guild_id}/scheduled-events/{event_id}"
-        headers = {"Authorization": f"Bot {self.bot_token}"}
-
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, headers=headers) as response:
-                if response.status == 200:
-                    return await response.json()
-                else:
-                    logger.error(f"Failed to fetch event details: {response.status}")
-                    return None
-
-    async def get_interested_people(self, guild_id, event_id, limit=100):
-        url = f"https://discord.com/api/v10/guilds/{guild_id}/scheduled-events/{event_id}/users"
-        headers = {"Authorization": f"Bot {self.bot_token}"}
-        params = {"limit": limit, "with_member": "true"}
+        status, details = await self.http.get(f"/guilds/{guild_id}/scheduled-events/{event_id}")
+        if status == 200:
+            return details
+        else:
+            logger.error("Failed to fetch event details: %s", status)
+            return None
 
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, headers=headers, params=params) as response:
-                if response.status == 200:
-                    users = await response.json()
-                    participants = []
-                    for user in users:
-                        member = user.get('member', user['user'])
-                        nickname = member.get('nick') or user['user']['username']
-                        role_ids = member.get('roles', [])
-                        participants.append((nickname, role_ids))
-                    return participants
-                else:
-                    logger.error(f"Failed to fetch users: {response.status}")
-                    return []
-
-    def sort_into_squadrons(self, participants):
-        squadrons = {name: [] for name in self.squadron_roles.values()}
-        squadrons["Unsorted"] = []
-
-        for nickname, role_ids in participants:
-            sorted_flag = False
-            for role_id in role_ids:
-                squadron_name = self.squadron_roles.get(str(role_id))
-                if squadron_name:
-                    squadrons[squadron_name].append(nickname)
-                    sorted_flag = True
-                    break
-            if not sorted_flag:
-                squadrons["Unsorted"].append(nickname)
-
-        return squadrons
+    async def iter_interested_pages(self, guild_id, event_id, limit=100):
+        """Yield pages of (user_id, nickname, role_ids), following the after cursor.
+        The next page is requested before the current one is handed out"""
+        path = f"/guilds/{guild_id}/scheduled-events/{event_id}/users"
+        params = {"limit": limit, "with_member": "true"}
+        next_page = asyncio.ensure_future(self.http.get(path, params))
+        try:
+            while next_page:
+                status, users = await next_page
+                next_page = None
+                if status != 200:
+                    raise RestError(status)
+
+                if len(users) == limit:
+                    params = {**params, "after": users[-1]['user']['id']}
+                    next_page = asyncio.ensure_future(self.http.get(path, params))
+
+                participants = []
+                for user in users:
+                    member = user.get('member', user['user'])
+                    nickname = member.get('nick') or user['user']['username']
+                    role_ids = member.get('roles', [])
+                    participants.append((user['user']['id'], nickname, role_ids))
+                yield participants
+        finally:
+            if next_page:
+                next_page.cancel()
 
 def setup(bot):
     logger.debug("Setting up RSVP extension...")
@@ -0,0 +1,50 @@
+import os
+import interactions
+from interactions import listen
+from interactions.api.events import Ready, MemberAdd, MemberRemove, MemberUpdate, RoleDelete
+from config import COMPACT_MEMBER_CACHE
+from src import logutil
+from src.squadrons import SquadronIndex
+
+logger = logutil.init_logger(os.path.basename(__file__))
+
+INTENTS = interactions.Intents.GUILDS | interactions.Intents.GUILD_MEMBERS
+
+class SquadronTracker(interactions.Extension):
+    def __init__(self, bot):
+        self.bot = bot
+        logger.debug("Initializing SquadronTracker extension...")
+
+        # Shared with the roster, RSVP and application handler extensions
+        self.bot.squadrons = SquadronIndex(bot, compact=COMPACT_MEMBER_CACHE)
+
+        logger.debug("SquadronTracker extension initialized.")
+
+    @listen(Ready)
+    async def on_ready(self, event: Ready):
+        logger.debug("Bot is ready, indexing squadrons...")
+        await self.bot.squadrons.build()
+        logger.debug("Squadrons indexed.")
+
+    @listen(MemberAdd)
+    async def on_member_add(self, event: MemberAdd):
+        self.bot.squadrons.index_member(event.member)
+
+    @listen(MemberUpdate)
+    async def on_member_update(self, event: MemberUpdate):
+        self.bot.squadrons.index_member(event.after)
+
+    @listen(MemberRemove)
+    async def on_member_remove(self, event: MemberRemove):
+        self.bot.squadrons.remove_member(event.member.id, event.guild_id)
+
+    @listen(RoleDelete)
+    async def on_role_delete(self, event: RoleDelete):
+        if int(event.id) in self.bot.squadrons.role_priority:
+            logger.debug("Squadron role %s deleted, reindexing", event.id)
+            self.bot.squadrons.remove_role(event.guild_id, event.id)
+
+def setup(bot):
+    logger.debug("Setting up SquadronTracker extension...")
+    SquadronTracker(bot)
+    logger.debug("SquadronTracker extension setup complete")
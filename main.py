@@ -3,14 +3,20 @@ Main script to run
 
 This script initializes extensions and starts the bot
 """
+import importlib
 import os
+import signal
 import sys
 
 import interactions
 from dotenv import load_dotenv
+from interactions.client.smart_cache import create_cache
 
-from config import DEBUG, DEV_GUILD
-from src import logutil
+from config import COMPACT_MEMBER_CACHE, DEBUG, DEFERRED_EXTENSIONS, DEV_GUILD, LIBRARY_MEMBER_CACHE_LIMIT
+from src import logutil, persist
+from src.startup import StartupTimeline
+
+timeline = StartupTimeline()
 
 load_dotenv()
 
@@ -27,35 +33,119 @@ if not os.environ.get("TOKEN"):
     logger.critical("TOKEN variable not set. Cannot continue")
     sys.exit(1)
 
-intents = interactions.Intents.ALL
+# Caches that are shrunk or switched off when no extension lists them in CACHES.
+# The library warns about an unbounded message cache, so it keeps a tiny one instead
+OPTIONAL_CACHES = {
+    "message_cache": lambda: create_cache(ttl=60, hard_limit=20),
+    "voice_state_cache": lambda: create_cache(0, 0, 0),
+}
+
+# get all python files in "extensions" folder
+extensions = [
+    f"extensions.{f[:-3]}"
+    for f in os.listdir("extensions")
+    if f.endswith(".py") and not f.startswith("_")
+]
+
+# Import the extensions first so the client only asks for the intents and
+# caches they declare (INTENTS / CACHES at module level)
+modules = {}
+for extension in extensions:
+    try:
+        with timeline.measure(extension, "import"):
+            modules[extension] = importlib.import_module(extension)
+    except Exception as e:
+        logger.exception("Failed to import extension %s.", extension, exc_info=e)
+
+intents = interactions.Intents.GUILDS
+for module in modules.values():
+    intents |= getattr(module, "INTENTS", interactions.Intents.DEFAULT)
+logger.info("Connecting with intents: %r", intents)
+
+needed_caches = {cache for module in modules.values() for cache in getattr(module, "CACHES", ())}
+caches = {
+    cache: make_cache()
+    for cache, make_cache in OPTIONAL_CACHES.items()
+    if cache not in needed_caches
+}
+
+# Extensions read members from the squadron index's compact cache instead
+if COMPACT_MEMBER_CACHE:
+    caches["member_cache"] = create_cache(ttl=600, hard_limit=LIBRARY_MEMBER_CACHE_LIMIT)
+    caches["user_cache"] = create_cache(ttl=600, hard_limit=LIBRARY_MEMBER_CACHE_LIMIT)
 
 client = interactions.Client(
     token=os.environ.get("TOKEN"),
     intents=intents,
+    **caches,
     activity=interactions.Activity(
         name="with interactions", type=interactions.ActivityType.PLAYING
     ),
     debug_scope=DEV_GUILD,
 )
+client.startup = timeline
+timeline.mark("client_created")
+
+
+def load(extension):
+    """Load an extension, timing it and its Ready listeners. Returns the extensions it added"""
+    before = set(client.ext)
+    try:
+        with timeline.measure(extension, "load"):
+            client.load_extension(extension)
+        logger.info("Loaded extension %s", extension)
+    except interactions.errors.ExtensionLoadException as e:
+        logger.exception("Failed to load extension %s.", extension, exc_info=e)
+        return []
+    added = [ext for name, ext in client.ext.items() if name not in before]
+    for ext in added:
+        timeline.wrap_ready_listeners(extension, ext)
+    return added
+
+
+async def load_deferred(extension):
+    # Ready has already fired, so run the extension's own Ready listeners once it's loaded
+    for ext in load(extension):
+        for listener in ext.listeners:
+            if listener.event == "ready":
+                event = interactions.events.Ready()
+                event.bot = client
+                try:
+                    await (listener(event) if listener.pass_event_object else listener())
+                except Exception:
+                    logger.exception("Ready listener %s of %s failed", listener.callback.__name__, extension)
+    timeline.finish((extension, "deferred"))
 
 
 @interactions.listen()
 async def on_startup():
     """Called when the bot starts"""
-    logger.info(f"Logged in as {client.user}")
+    logger.info("Logged in as %s", client.user)
+    timeline.mark("logged_in")
 
+    # Heavy extensions load once the bot is already answering commands
+    for extension in deferred:
+        await load_deferred(extension)
+
+
+deferred = [extension for extension in modules if extension in DEFERRED_EXTENSIONS]
+for extension in deferred:
+    timeline.deferred.add(extension)
+    timeline.expect((extension, "deferred"))
+
+for extension in modules:
+    if extension not in deferred:
+        load(extension)
+
+
+def on_sigterm(signum, frame):
+    # Shut down like Ctrl+C, so the client stops cleanly and pending writes are flushed
+    raise KeyboardInterrupt
 
-# get all python files in "extensions" folder
-extensions = [
-    f"extensions.{f[:-3]}"
-    for f in os.listdir("extensions")
-    if f.endswith(".py") and not f.startswith("_")
-]
-for extension in extensions:
-    try:
-        client.load_extension(extension)
-        logger.info(f"Loaded extension {extension}")
-    except interactions.errors.ExtensionLoadException as e:
-        logger.exception(f"Failed to load extension {extension}.", exc_info=e)
 
-client.start()
+signal.signal(signal.SIGTERM, on_sigterm)
+try:
+    client.start()
+finally:
+    # Debounced writes still waiting for their delay when the bot stopped
+    persist.flush_all()
@@ -0,0 +1,143 @@
+"""
+Application store
+
+SQLite backed storage for recruit applications, indexed by User ID and Status.
+The legacy applications.csv is imported once on first use and can still be
+exported for the admins.
+"""
+
+import csv
+import io
+import json
+import os
+import sqlite3
+
+from src import logutil
+
+logger = logutil.init_logger(os.path.basename(__file__))
+
+DB_FILE = 'applications.db'
+CSV_FILE = 'applications.csv'
+
+# Column order of the exported CSV, matches the legacy applications.csv
+APPLICATION_FIELDS = [
+    "Username",
+    "Which Squadron are you applying to join?",
+    "Requested Callsign",
+    "Are you a member of another DCS Squadron?",
+    "What style of play are you into when playing DCS?",
+    "Are you already an accepted member of HVY?",
+    "Are you a former member of Joint Task Force Heavy?",
+    "Are you over the age of 18?",
+    "Discord Username",
+    "User ID",
+    "Status",
+    "Timestamp",
+    "Duration"
+]
+
+
+class ApplicationStore:
+    """Applications keyed by row id with indexes on User ID and Status"""
+
+    def __init__(self, path=DB_FILE, csv_file=CSV_FILE):
+        self.conn = sqlite3.connect(path)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS applications (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id TEXT NOT NULL,
+                status TEXT NOT NULL,
+                data TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_applications_user ON applications (user_id);
+            CREATE INDEX IF NOT EXISTS idx_applications_status ON applications (status);
+            """
+        )
+        self.conn.commit()
+
+        if self.count() == 0 and os.path.isfile(csv_file):
+            self.import_csv(csv_file)
+
+    @staticmethod
+    def _to_dict(row):
+        application = json.loads(row["data"])
+        application["User ID"] = row["user_id"]
+        application["Status"] = row["status"]
+        return application
+
+    def count(self):
+        return self.conn.execute("SELECT COUNT(*) FROM applications").fetchone()[0]
+
+    def import_csv(self, csv_file):
+        """One-off import of the legacy CSV file"""
+        with open(csv_file, 'r', newline='') as file:
+            rows = list(csv.DictReader(file))
+        with self.conn:
+            for row in rows:
+                self._insert(row)
+        logger.info("Imported %d applications from %s", len(rows), csv_file)
+
+    def _insert(self, application):
+        data = {k: v for k, v in application.items() if k not in ("User ID", "Status")}
+        cursor = self.conn.execute(
+            "INSERT INTO applications (user_id, status, data) VALUES (?, ?, ?)",
+            (str(application["User ID"]), application["Status"], json.dumps(data))
+        )
+        return cursor.lastrowid
+
+    def add(self, application):
+        """Store a new application dict, returns its row id"""
+        with self.conn:
+            return self._insert(application)
+
+    def get(self, user_id):
+        """Most recent application for a user, or None"""
+        row = self.conn.execute(
+            "SELECT * FROM applications WHERE user_id = ? ORDER BY id DESC LIMIT 1",
+            (str(user_id),)
+        ).fetchone()
+        return self._to_dict(row) if row else None
+
+    def by_status(self, status):
+        rows = self.conn.execute(
+            "SELECT * FROM applications WHERE status = ? ORDER BY id",
+            (status,)
+        ).fetchall()
+        return [self._to_dict(row) for row in rows]
+
+    def update_status(self, user_id, new_status, old_status=None):
+        """Set the status of a user's most recent application, optionally only the most recent
+        one currently in old_status. Earlier applications keep their status.
+        Returns the number of rows changed"""
+        latest = "SELECT id FROM applications WHERE user_id = ?"
+        params = [new_status, str(user_id)]
+        if old_status is not None:
+            latest += " AND status = ?"
+            params.append(old_status)
+        query = f"UPDATE applications SET status = ? WHERE id = ({latest} ORDER BY id DESC LIMIT 1)"
+        with self.conn:
+            cursor = self.conn.execute(query, params)
+        return cursor.rowcount
+
+    def export_csv(self):
+        """Render every application as CSV text in the legacy column order"""
+        output = io.StringIO()
+        writer = csv.DictWriter(output, fieldnames=APPLICATION_FIELDS, restval='', extrasaction='ignore')
+        writer.writeheader()
+        for row in self.conn.execute("SELECT * FROM applications ORDER BY id"):
+            writer.writerow(self._to_dict(row))
+        return output.getvalue()
+
+
+_store = None
+
+
+def get_store():
+    """Shared store instance used by the application extensions"""
+    global _store
+    if _store is None:
+        _store = ApplicationStore()
+    return _store
@@ -0,0 +1,65 @@
+"""
+Scheduled event attendance cache
+
+Holds the sorted attendee list of recently viewed events so /getpilots can
+answer from memory. Entries are patched in place from RSVP add/remove
+events and expire after a TTL as a safety net against missed events.
+"""
+
+import time
+
+
+class Attendance:
+    """Attendees of one event, user id -> (nickname, squadron name)"""
+
+    __slots__ = ("event_id", "title", "date", "attendees", "fetched_at")
+
+    def __init__(self, event_id, title, date, attendees):
+        self.event_id = event_id
+        self.title = title
+        self.date = date
+        self.attendees = attendees
+        self.fetched_at = time.monotonic()
+
+    def squadrons(self, squadron_names, unsorted="Unsorted"):
+        """Nicknames grouped by squadron, in squadron priority order"""
+        squadrons = {name: [] for name in squadron_names}
+        squadrons[unsorted] = []
+        for nickname, squadron in self.attendees.values():
+            squadrons.setdefault(squadron or unsorted, []).append(nickname)
+        return squadrons
+
+
+class AttendanceCache:
+    def __init__(self, ttl=600):
+        self.ttl = ttl
+        self.entries = {}
+
+    def get(self, event_id):
+        """Cached attendance, or None if missing or expired"""
+        entry = self.entries.get(int(event_id))
+        if entry and time.monotonic() - entry.fetched_at > self.ttl:
+            del self.entries[int(event_id)]
+            return None
+        return entry
+
+    def put(self, entry):
+        self.entries[int(entry.event_id)] = entry
+
+    def add(self, event_id, user_id, nickname, squadron):
+        """Patch a new attendee into a cached event, returns False if the event isn't cached"""
+        entry = self.get(event_id)
+        if entry is None:
+            return False
+        entry.attendees[int(user_id)] = (nickname, squadron)
+        return True
+
+    def remove(self, event_id, user_id):
+        entry = self.get(event_id)
+        if entry is None:
+            return False
+        entry.attendees.pop(int(user_id), None)
+        return True
+
+    def invalidate(self, event_id):
+        self.entries.pop(int(event_id), None)
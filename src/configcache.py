@@ -0,0 +1,73 @@
+"""
+Shared configuration cache
+
+JSON config files are parsed once and kept in memory. Each access does a
+single stat() and only re-reads the file when its mtime has changed, so
+edits are picked up without a restart.
+"""
+
+import json
+import os
+
+from src import logutil
+
+logger = logutil.init_logger(os.path.basename(__file__))
+
+APPLICATION_FILE = 'application.json'
+SQ_ROLES_FILE = 'sq_roles.json'
+ANNOUNCEMENT_BODIES_FILE = 'announcement_bodies.json'
+
+# path -> (mtime_ns, parsed data)
+_cache = {}
+
+
+def load_json(path):
+    """Parsed contents of path, re-read only when the file has changed"""
+    mtime = os.stat(path).st_mtime_ns
+    cached = _cache.get(path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+
+    try:
+        with open(path, 'r') as f:
+            data = json.load(f)
+    except ValueError:
+        if cached:
+            # Keep serving the last good copy rather than breaking commands mid-edit
+            logger.exception("Failed to parse %s, keeping previous version", path)
+            return cached[1]
+        raise
+
+    if cached:
+        logger.info("Reloaded %s", path)
+    _cache[path] = (mtime, data)
+    return data
+
+
+def reload(paths=None):
+    """Force a re-read of the given (default: all cached) files.
+    Returns {path: error message or None}"""
+    results = {}
+    for path in list(paths or _cache):
+        previous = _cache.pop(path, None)
+        try:
+            load_json(path)
+            results[path] = None
+        except (OSError, ValueError) as e:
+            if previous:
+                _cache[path] = previous
+            results[path] = str(e)
+    return results
+
+
+def application_config():
+    return load_json(APPLICATION_FILE)
+
+
+def squadron_roles():
+    """Role id (str) -> squadron name, from sq_roles.json"""
+    return load_json(SQ_ROLES_FILE)['squadron_roles']
+
+
+def announcement_bodies():
+    return load_json(ANNOUNCEMENT_BODIES_FILE)['announcements']
@@ -0,0 +1,130 @@
+"""
+Outbound message dispatcher
+
+Bot-initiated channel messages (join logs, admin alerts, announcements) go
+through one queue per channel, so a burst is sent one message at a time
+into that channel's rate limit bucket instead of many sends racing for it.
+Queues are ordered by priority, so admin alerts overtake queued join logs.
+Digest messages arriving within a short window are merged into one.
+"""
+
+import asyncio
+import heapq
+import itertools
+import os
+
+from src import logutil
+
+logger = logutil.init_logger(os.path.basename(__file__))
+
+PRIORITY_ALERT = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOG = 2
+
+MESSAGE_MAX_LENGTH = 2000
+DIGEST_WINDOW = 5.0  # seconds digest messages are collected before they are merged and sent
+DIGEST_SEPARATOR = "\n\n"
+
+
+def merge_digest(contents, limit=MESSAGE_MAX_LENGTH):
+    """Join message bodies into as few messages of at most limit characters as possible"""
+    merged = []
+    for content in contents:
+        content = content[:limit]
+        if merged and len(merged[-1]) + len(DIGEST_SEPARATOR) + len(content) <= limit:
+            merged[-1] += DIGEST_SEPARATOR + content
+        else:
+            merged.append(content)
+    return merged
+
+
+class Dispatcher:
+    def __init__(self, bot, digest_window=DIGEST_WINDOW):
+        self.bot = bot
+        self.digest_window = digest_window
+
+        self.channels = {}  # channel id -> resolved channel
+        self.queues = {}  # channel id -> heap of (priority, seq, kwargs, future)
+        self.workers = {}  # channel id -> drain task
+        self.digests = {}  # (channel id, priority) -> [(content, future)]
+        self.seq = itertools.count()
+
+    async def get_channel(self, channel_id):
+        if channel_id not in self.channels:
+            self.channels[channel_id] = await self.bot.fetch_channel(channel_id)
+        return self.channels[channel_id]
+
+    def send(self, channel_id, content=None, priority=PRIORITY_NORMAL, digest=False, **kwargs):
+        """Queue a message for channel_id. Returns a future resolved with the sent message,
+        which callers may await or ignore. Digest messages are text only and may be merged"""
+        future = asyncio.get_running_loop().create_future()
+        if digest:
+            key = (channel_id, priority)
+            if key not in self.digests:
+                self.digests[key] = []
+                asyncio.get_running_loop().call_later(self.digest_window, self._flush_digest, key)
+            self.digests[key].append((content, future))
+        else:
+            self._enqueue(channel_id, priority, dict(kwargs, content=content), future)
+        return future
+
+    def _flush_digest(self, key):
+        channel_id, priority = key
+        pending = self.digests.pop(key, [])
+        futures = [future for _, future in pending]
+        merged = merge_digest([content for content, _ in pending])
+        for i, content in enumerate(merged):
+            # Every caller's future follows the last message, so awaiting means "fully delivered"
+            future = asyncio.get_running_loop().create_future()
+            if i == len(merged) - 1:
+                future.add_done_callback(lambda done: self._resolve_all(done, futures))
+            self._enqueue(channel_id, priority, {"content": content}, future)
+
+    @staticmethod
+    def _resolve_all(done, futures):
+        for future in futures:
+            if future.done():
+                continue
+            if done.exception():
+                future.set_exception(done.exception())
+                future.exception()
+            else:
+                future.set_result(done.result())
+
+    def _enqueue(self, channel_id, priority, kwargs, future):
+        heapq.heappush(self.queues.setdefault(channel_id, []), (priority, next(self.seq), kwargs, future))
+        worker = self.workers.get(channel_id)
+        if worker is None or worker.done():
+            self.workers[channel_id] = asyncio.create_task(self._drain(channel_id))
+
+    async def _drain(self, channel_id):
+        queue = self.queues[channel_id]
+        while queue:
+            _, _, kwargs, future = heapq.heappop(queue)
+            try:
+                channel = await self.get_channel(channel_id)
+                message = await channel.send(**kwargs)
+            except Exception as e:
+                logger.exception("Failed to send queued message to channel %s", channel_id)
+                if not future.done():
+                    future.set_exception(e)
+                    # Nobody may be awaiting it; don't warn about an unretrieved exception
+                    future.exception()
+            else:
+                if not future.done():
+                    future.set_result(message)
+
+    def pending(self):
+        """Queued messages per channel, digests not yet merged included"""
+        counts = {channel_id: len(queue) for channel_id, queue in self.queues.items() if queue}
+        for (channel_id, _), items in self.digests.items():
+            counts[channel_id] = counts.get(channel_id, 0) + len(items)
+        return counts
+
+
+def get_dispatcher(bot):
+    """The bot's dispatcher, created on first use"""
+    dispatcher = getattr(bot, "message_dispatcher", None)
+    if dispatcher is None:
+        dispatcher = bot.message_dispatcher = Dispatcher(bot)
+    return dispatcher
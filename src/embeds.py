@@ -0,0 +1,78 @@
+"""
+Embed pagination helpers
+
+Splits long lists across fields, embeds and messages so output stays within
+Discord's limits (1024 chars per field value, 25 fields and 6000 chars per
+embed, 10 embeds and 6000 chars per message).
+"""
+
+import interactions
+from interactions.client.const import (
+    EMBED_FIELD_VALUE_LENGTH,
+    EMBED_MAX_FIELDS,
+    EMBED_TOTAL_MAX,
+)
+
+EMBEDS_PER_MESSAGE = 10
+
+
+def chunk_lines(lines, limit=EMBED_FIELD_VALUE_LENGTH):
+    """Join lines with newlines into chunks of at most limit characters"""
+    chunk = []
+    size = 0
+    for line in lines:
+        line = line[:limit]
+        extra = len(line) + (1 if chunk else 0)
+        if chunk and size + extra > limit:
+            yield "\n".join(chunk)
+            chunk, size = [], 0
+            extra = len(line)
+        chunk.append(line)
+        size += extra
+    if chunk:
+        yield "\n".join(chunk)
+
+
+def build_embeds(title, fields, description=None, color=None, author=None, footer=None):
+    """Pack (name, value) fields into as many embeds as needed.
+    The author goes on the first embed and the footer on the last"""
+    embeds = []
+
+    def new_embed():
+        embed = interactions.Embed(
+            title=title if not embeds else f"{title} (cont.)",
+            description=description if not embeds else None,
+            color=color,
+        )
+        if author and not embeds:
+            embed.set_author(name=author)
+        embeds.append(embed)
+        return embed
+
+    embed = new_embed()
+    # Leave room for the footer on whichever embed ends up last
+    budget = EMBED_TOTAL_MAX - len(footer or "")
+    for name, value in fields:
+        if len(embed.fields) >= EMBED_MAX_FIELDS or len(embed) + len(name) + len(value) > budget:
+            embed = new_embed()
+        embed.add_field(name=name, value=value, inline=False)
+
+    if footer:
+        embeds[-1].set_footer(text=footer)
+    return embeds
+
+
+def group_for_messages(embeds):
+    """Group embeds into per-message batches that respect the per-message limits"""
+    batches = []
+    batch = []
+    size = 0
+    for embed in embeds:
+        if batch and (len(batch) >= EMBEDS_PER_MESSAGE or size + len(embed) > EMBED_TOTAL_MAX):
+            batches.append(batch)
+            batch, size = [], 0
+        batch.append(embed)
+        size += len(embed)
+    if batch:
+        batches.append(batch)
+    return batches
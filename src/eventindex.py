@@ -0,0 +1,120 @@
+"""
+Scheduled event index
+
+Keeps guild scheduled events as compact records keyed by event id, with a
+start-time ordering that is maintained as events are created, updated and
+deleted instead of being rebuilt and re-sorted each time.
+"""
+
+import bisect
+import time
+from datetime import datetime, timezone
+from typing import NamedTuple
+
+# ScheduledEventStatus values that mean the event is over
+FINISHED_STATUSES = (3, 4)
+
+
+class EventRecord(NamedTuple):
+    id: int
+    guild_id: int
+    name: str
+    start: float  # Unix timestamp
+    status: int
+
+    @property
+    def start_time(self):
+        return datetime.fromtimestamp(self.start, timezone.utc)
+
+    @classmethod
+    def from_payload(cls, data):
+        """From a REST/gateway scheduled event dict (or a legacy events.json entry)"""
+        return cls(
+            int(data["id"]),
+            int(data["guild_id"]),
+            data["name"],
+            datetime.fromisoformat(data["scheduled_start_time"]).timestamp(),
+            int(data.get("status", 1)),
+        )
+
+    @classmethod
+    def from_event(cls, event):
+        """From an interactions ScheduledEvent object"""
+        return cls(int(event.id), int(event._guild_id), event.name, event.start_time.timestamp(), int(event.status))
+
+    def to_json(self):
+        return [self.id, self.guild_id, self.name, self.start, self.status]
+
+    @classmethod
+    def from_json(cls, data):
+        if isinstance(data, dict):
+            return cls.from_payload(data)
+        return cls(*data)
+
+
+class EventIndex:
+    """Scheduled events by id plus a (start, id) ordering kept sorted with bisect"""
+
+    def __init__(self, records=()):
+        self.events = {}
+        self.order = []
+        for record in records:
+            self.upsert(record)
+
+    def __len__(self):
+        return len(self.events)
+
+    def __contains__(self, event_id):
+        return int(event_id) in self.events
+
+    def get(self, event_id):
+        return self.events.get(int(event_id))
+
+    def _unlink(self, record):
+        key = (record.start, record.id)
+        i = bisect.bisect_left(self.order, key)
+        if i < len(self.order) and self.order[i] == key:
+            del self.order[i]
+
+    def upsert(self, record):
+        """Insert or replace a record. Finished events are dropped"""
+        old = self.events.get(record.id)
+        if old:
+            self._unlink(old)
+        if record.status in FINISHED_STATUSES:
+            self.events.pop(record.id, None)
+            return
+        self.events[record.id] = record
+        bisect.insort(self.order, (record.start, record.id))
+
+    def remove(self, event_id):
+        record = self.events.pop(int(event_id), None)
+        if record:
+            self._unlink(record)
+        return record
+
+    def replace_guild(self, guild_id, records):
+        """Full resync of one guild's events"""
+        for record in [r for r in self.events.values() if r.guild_id == guild_id]:
+            self.remove(record.id)
+        for record in records:
+            self.upsert(record)
+
+    def prune(self, now=None):
+        """Drop events that have already started, returns how many were removed"""
+        now = now or time.time()
+        i = bisect.bisect_right(self.order, (now, float("inf")))
+        for _, event_id in self.order[:i]:
+            del self.events[event_id]
+        del self.order[:i]
+        return i
+
+    def upcoming(self, limit=None, now=None):
+        """Records starting after now, soonest first"""
+        now = now or time.time()
+        i = bisect.bisect_right(self.order, (now, float("inf")))
+        end = len(self.order) if limit is None else i + limit
+        return [self.events[event_id] for _, event_id in self.order[i:end]]
+
+    def to_json(self):
+        return [self.events[event_id].to_json() for _, event_id in self.order]
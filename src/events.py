@@ -0,0 +1,17 @@
+"""
+Custom events dispatched between extensions
+
+These go through the client's own event bus, so any extension can
+subscribe to them with @listen(EventClass).
+"""
+
+import attrs
+from interactions.api.events import BaseEvent
+
+
+@attrs.define(eq=False, order=False, hash=False, kw_only=False)
+class ApplicationSubmitted(BaseEvent):
+    """Dispatched when a recruit finishes their application"""
+
+    application: dict = attrs.field(repr=False)
+    """The stored application, keyed by the application.csv column names"""
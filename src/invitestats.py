@@ -0,0 +1,78 @@
+"""
+Running invite log aggregates
+
+Join counts per referrer, per invite code and per ISO week, updated as
+entries are logged so /invitestats never has to scan the invite history.
+The counters are saved next to the log. A saved copy that is behind the
+log is caught up from the entries after its last counted one; the counters
+are only rebuilt from the log, which keeps recent history only, when the
+saved copy is missing or unreadable.
+"""
+
+from collections import Counter
+from datetime import datetime
+
+UNKNOWN_WEEK = "Unknown"
+
+
+def week_of(timestamp):
+    """ISO week bucket ("2024-W07") of an invite log timestamp"""
+    try:
+        year, week, _ = datetime.fromisoformat(timestamp).isocalendar()
+    except (TypeError, ValueError):
+        return UNKNOWN_WEEK
+    return f"{year}-W{week:02d}"
+
+
+class InviteStats:
+    def __init__(self):
+        self.total = 0
+        self.last = None  # newest entry counted, to tell whether the saved copy matches the log
+        self.referrers = Counter()
+        self.codes = Counter()
+        self.weeks = Counter()
+
+    def add(self, entry):
+        self.total += 1
+        self.last = entry
+        self.referrers[entry.get("referrer", "Unknown")] += 1
+        self.codes[entry.get("code", "Unknown")] += 1
+        self.weeks[week_of(entry.get("timestamp"))] += 1
+
+    @classmethod
+    def rebuild(cls, entries):
+        stats = cls()
+        for entry in entries:
+            stats.add(entry)
+        return stats
+
+    def to_json(self):
+        return {
+            "total": self.total,
+            "last": self.last,
+            "referrers": dict(self.referrers),
+            "codes": dict(self.codes),
+            "weeks": dict(self.weeks),
+        }
+
+    @classmethod
+    def from_json(cls, data):
+        stats = cls()
+        stats.total = data["total"]
+        stats.last = data.get("last")
+        stats.referrers.update(data["referrers"])
+        stats.codes.update(data["codes"])
+        stats.weeks.update(data["weeks"])
+        return stats
+
+    def page(self, view, page, per_page=10):
+        """(rows, page number, page count) for one page of a view, the page clamped to the valid range.
+        Referrers and codes are ranked by joins, weeks are newest first"""
+        counter = getattr(self, view)
+        if view == "weeks":
+            rows = sorted(counter.items(), key=lambda row: (row[0] != UNKNOWN_WEEK, row[0]), reverse=True)
+        else:
+            rows = counter.most_common()
+        pages = max(1, -(-len(rows) // per_page))
+        page = min(max(page, 1), pages)
+        return rows[(page - 1) * per_page:page * per_page], page, pages
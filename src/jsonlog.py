@@ -0,0 +1,103 @@
+"""
+Append-only JSON lines log with size based rotation
+
+Entries are appended one line at a time, so writes don't grow with the
+log. The newest entries are kept in a small in-memory tail that is loaded
+by reading backwards from the end of the file, so startup doesn't read
+the whole history either.
+"""
+
+import json
+import os
+from collections import deque
+
+READ_BLOCK = 8192
+
+
+def _read_last_lines(path, count):
+    """Up to count last non-empty lines of path, oldest first, reading backwards in blocks"""
+    if count <= 0 or not os.path.exists(path):
+        return []
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        position = f.tell()
+        data = b''
+        while position > 0 and data.count(b'\n') <= count:
+            size = min(READ_BLOCK, position)
+            position -= size
+            f.seek(position)
+            data = f.read(size) + data
+    lines = [line for line in data.split(b'\n') if line.strip()]
+    if position > 0:
+        # The first line may be cut off mid-way
+        lines = lines[1:]
+    return [line.decode() for line in lines[-count:]]
+
+
+class RotatingJsonLog:
+    def __init__(self, path, max_bytes=1024 * 1024, backups=5, tail_size=100):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.tail = deque(maxlen=tail_size)
+
+        # Fill the tail from the current file, topping up from the newest backups if it's short
+        lines = []
+        for file in self.files()[::-1]:
+            lines = _read_last_lines(file, tail_size - len(lines)) + lines
+            if len(lines) >= tail_size:
+                break
+        self.tail.extend(json.loads(line) for line in lines)
+
+    def files(self):
+        """Log files that exist, oldest first"""
+        files = [f"{self.path}.{i}" for i in range(self.backups, 0, -1)] + [self.path]
+        return [file for file in files if os.path.exists(file)]
+
+    def rotate(self):
+        for i in range(self.backups - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{i}"):
+                os.replace(f"{self.path}.{i}", f"{self.path}.{i + 1}")
+        os.replace(self.path, f"{self.path}.1")
+
+    def append(self, entry):
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(entry, separators=(',', ':')) + "\n")
+            size = f.tell()
+        self.tail.append(entry)
+        if size >= self.max_bytes:
+            self.rotate()
+
+    def last(self, count):
+        """The newest count entries (at most tail_size), oldest first"""
+        count = min(count, len(self.tail))
+        return list(self.tail)[len(self.tail) - count:]
+
+    def since(self, entry):
+        """Entries logged after the newest one equal to entry, oldest first (all of them for None).
+        None if entry is no longer in the retained log"""
+        if entry is None:
+            return list(self)
+        tail = list(self.tail)
+        for i in range(len(tail) - 1, -1, -1):
+            if tail[i] == entry:
+                return tail[i + 1:]
+
+        # Older than the tail, scan the files
+        found = False
+        newer = []
+        for logged in self:
+            if logged == entry:
+                found = True
+                newer = []
+            else:
+                newer.append(logged)
+        return newer if found else None
+
+    def __iter__(self):
+        """Every retained entry, oldest first"""
+        for file in self.files():
+            with open(file, 'r') as f:
+                for line in f:
+                    if line.strip():
+                        yield json.loads(line)
@@ -4,10 +4,29 @@ Custom logging script
 Code taken from my contributions in:
 https://github.com/savioxavier/repo-finder-bot/
 Additional thanks to savioxavier
+
+Loggers only put records on a queue; a single QueueListener thread applies
+the console/JSON layouts and does the console (and optional JSON file)
+writes, so logging never blocks the event loop on I/O. The message itself
+(msg % args and any traceback) is formatted on the calling thread before it
+is queued, while the arguments still have the values they were logged with.
 """
 
+import atexit
+import json
 import logging
-from config import DEBUG  # pylint: disable=import-error # This works fine?
+import logging.handlers
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+from config import DEBUG, LOG_JSON_BACKUPS, LOG_JSON_FILE, LOG_JSON_MAX_BYTES  # pylint: disable=import-error # This works fine?
+
+LEVEL = logging.DEBUG if DEBUG else logging.INFO
+DEDUP_WINDOW = 60  # seconds identical messages are collapsed for
+DEDUP_BURST = 3  # identical messages let through per window before collapsing
+DEDUP_SITE_BURST = 20  # messages from one logging call let through per window, whatever the arguments
+DEDUP_SWEEP_INTERVAL = 5  # seconds between checks for summaries that are due
 
 
 class CustomFormatter(logging.Formatter):
@@ -57,18 +76,184 @@ class CustomFormatter(logging.Formatter):
         }
     )
 
+    def __init__(self):
+        super().__init__()
+        # One formatter per level, built once instead of per record
+        self.formatters = {
+            level: logging.Formatter(log_fmt, datefmt="%I:%M.%S%p", validate=False)
+            for level, log_fmt in self.FORMATS.items()
+        }
+
     def format(self, record):
-        log_fmt = self.FORMATS.get(record.levelno)
-        formatter = logging.Formatter(log_fmt, datefmt="%I:%M.%S%p")
+        formatter = self.formatters.get(record.levelno, self.formatters[logging.INFO])
         return formatter.format(record)
 
 
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, for the log file sink"""
+
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "line": record.lineno,
+            "message": record.getMessage(),
+        }
+        return json.dumps(entry, separators=(",", ":"))
+
+
+class DedupFilter(logging.Filter):
+    """Lets the first few identical messages per window through and collapses the rest.
+
+    Two budgets apply per window: identical messages (call site, template and
+    arguments) get `burst` records, and a call site gets `site_burst` records
+    whatever its arguments, so a storm whose arguments change every time (a retry
+    delay, say) is bounded too. Records are matched without formatting them.
+    Suppressed records are reported as one summary line per key once its window
+    has passed; a background thread sweeps for those, and whatever is still
+    pending at exit is reported then.
+    """
+
+    def __init__(self, logger, window=DEDUP_WINDOW, burst=DEDUP_BURST, site_burst=DEDUP_SITE_BURST):
+        super().__init__()
+        self.logger = logger
+        self.window = window
+        self.burst = burst
+        self.site_burst = site_burst
+        # key -> [window start, records let through, records suppressed, last record]
+        self.seen = {}
+        self.sites = {}
+        # filter() runs on the logging thread, sweep() on the sweeper thread
+        self.lock = threading.Lock()
+        _filters.append(self)
+
+    @staticmethod
+    def _key(site, record):
+        try:
+            hash(record.args)
+        except TypeError:
+            # Unhashable arguments, match on the template alone
+            return site
+        return site + (record.args,)
+
+    def _entry(self, table, key, now, expired):
+        entry = table.get(key)
+        if entry is None or now - entry[0] >= self.window:
+            if entry is not None:
+                expired.append((table, entry))
+            entry = table[key] = [now, 0, 0, None]
+        return entry
+
+    def filter(self, record):
+        now = time.monotonic()
+        site = (record.levelno, record.pathname, record.lineno, record.msg)
+        expired = []
+        with self.lock:
+            exact = self._entry(self.seen, self._key(site, record), now, expired)
+            calls = self._entry(self.sites, site, now, expired)
+            if exact[1] >= self.burst:
+                blocked = exact
+            elif calls[1] >= self.site_burst:
+                blocked = calls
+            else:
+                blocked = None
+                exact[1] += 1
+                calls[1] += 1
+            if blocked is not None:
+                blocked[2] += 1
+                blocked[3] = record
+        self._summarise(expired)
+        return blocked is None
+
+    def sweep(self, force=False):
+        """Report suppressed records whose window has passed (every one when force)"""
+        now = time.monotonic()
+        expired = []
+        with self.lock:
+            for table in (self.seen, self.sites):
+                for key, entry in list(table.items()):
+                    if force or now - entry[0] >= self.window:
+                        del table[key]
+                        expired.append((table, entry))
+        self._summarise(expired)
+
+    def _summarise(self, expired):
+        # Outside the lock; summaries go straight to the handlers, past this filter
+        for table, (_, _, suppressed, record) in expired:
+            if not suppressed:
+                continue
+            if table is self.seen:
+                msg = "%s [repeated %d more times in %ds]"
+            else:
+                msg = "%s [%d more messages from this line suppressed in %ds]"
+            # This may run on the sweeper thread, long after the call: only hashable (immutable)
+            # arguments of an exact repeat are safe to format here, otherwise show the template
+            if table is self.seen and self._key((), record):
+                text = record.getMessage()
+            else:
+                text = str(record.msg)
+            summary = self.logger.makeRecord(
+                record.name, record.levelno, record.pathname, record.lineno,
+                msg, (text, suppressed, self.window), None,
+            )
+            self.logger.callHandlers(summary)
+
+
+_filters = []  # every DedupFilter, for the sweeper
+_sweeper_stop = threading.Event()
+
+
+def _sweep_filters():
+    while not _sweeper_stop.wait(DEDUP_SWEEP_INTERVAL):
+        for dedup in list(_filters):
+            dedup.sweep()
+
+
+def _flush_filters():
+    """Report every pending summary, at exit before the listener stops"""
+    _sweeper_stop.set()
+    for dedup in list(_filters):
+        dedup.sweep(force=True)
+
+
+_queue = queue.SimpleQueue()
+_listener = None
+
+
+def _start_listener():
+    """Start the thread that formats and writes queued records, once"""
+    global _listener  # pylint: disable=global-statement
+    if _listener is not None:
+        return
+    console = logging.StreamHandler()
+    console.setFormatter(CustomFormatter())
+    handlers = [console]
+    if LOG_JSON_FILE:
+        file_handler = logging.handlers.RotatingFileHandler(
+            LOG_JSON_FILE, maxBytes=LOG_JSON_MAX_BYTES, backupCount=LOG_JSON_BACKUPS, encoding="utf-8"
+        )
+        file_handler.setFormatter(JsonFormatter())
+        handlers.append(file_handler)
+    _listener = logging.handlers.QueueListener(_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    threading.Thread(target=_sweep_filters, name="log-dedup-sweeper", daemon=True).start()
+    # atexit runs these last registered first: summaries are queued before the listener drains
+    atexit.register(_listener.stop)
+    atexit.register(_flush_filters)
+
+
+def _queue_handler():
+    _start_listener()
+    return logging.handlers.QueueHandler(_queue)
+
+
 def overwrite_ipy_loggers():
+    formatter = CustomFormatter()
     for k, v in logging.Logger.manager.loggerDict.items():
-        print(k, v)
         if k in ["mixin", "dispatch", "http", "gateway", "client", "context"]:
-            for h in v.handlers:
-                h.setFormatter(CustomFormatter)
+            for h in getattr(v, "handlers", []):
+                h.setFormatter(formatter)
 
 
 def get_logger(name):
@@ -76,18 +261,16 @@ def get_logger(name):
     Useful for modules that have already initialized a logger, such as discord.py
     """
     __logger = logging.getLogger(name)
-    __logger.setLevel(logging.DEBUG if DEBUG else logging.INFO)
-    __ch = logging.StreamHandler()
-    __ch.setFormatter(CustomFormatter())
-    __logger.addHandler(__ch)
+    __logger.setLevel(LEVEL)
+    __logger.addHandler(_queue_handler())
     return __logger
 
 
-def init_logger(name="root"):
+def init_logger(name="root", dedup=True):
     """Function to create a designated logger for separate modules"""
-    __logger = logging.Logger(name)
-    __ch = logging.StreamHandler()
-    __ch.setLevel(logging.DEBUG if DEBUG else logging.INFO)
-    __ch.setFormatter(CustomFormatter())
-    __logger.addHandler(__ch)
+    # The level is set on the logger so disabled records are never even created
+    __logger = logging.Logger(name, LEVEL)
+    if dedup:
+        __logger.addFilter(DedupFilter(__logger))
+    __logger.addHandler(_queue_handler())
     return __logger
@@ -0,0 +1,100 @@
+"""
+Compact member cache
+
+Keeps only what the extensions read from members: nick, username, role
+ids and join date, in slotted records. Role id tuples are interned, so the
+many members sharing the same roles share one tuple. With this cache on,
+the library's own member cache can be capped (see COMPACT_MEMBER_CACHE in
+config.py).
+"""
+
+from datetime import datetime
+
+
+class MemberRecord:
+    __slots__ = ("id", "guild_id", "nick", "username", "role_ids", "joined_at")
+
+    def __init__(self, id, guild_id, nick, username, role_ids, joined_at):
+        self.id = id
+        self.guild_id = guild_id
+        self.nick = nick
+        self.username = username
+        self.role_ids = role_ids
+        self.joined_at = joined_at
+
+    @property
+    def display_name(self):
+        return self.nick or self.username
+
+    @classmethod
+    def from_member(cls, member):
+        """From an interactions Member"""
+        return cls(
+            int(member.id),
+            int(member.guild.id),
+            member.nick,
+            member.user.username,
+            tuple(int(role.id) for role in member.roles),
+            member.joined_at,
+        )
+
+    @classmethod
+    def from_payload(cls, guild_id, data):
+        """From a REST guild member dict"""
+        joined_at = data.get("joined_at")
+        return cls(
+            int(data["user"]["id"]),
+            int(guild_id),
+            data.get("nick"),
+            data["user"]["username"],
+            tuple(int(role_id) for role_id in data.get("roles", [])),
+            datetime.fromisoformat(joined_at) if joined_at else None,
+        )
+
+
+class MemberCache:
+    """guild id -> member id -> MemberRecord"""
+
+    def __init__(self):
+        self.guilds = {}
+        self.role_sets = {}  # interned role id tuples
+
+    def __len__(self):
+        return sum(len(members) for members in self.guilds.values())
+
+    def intern_roles(self, role_ids):
+        key = tuple(sorted(int(role_id) for role_id in role_ids))
+        return self.role_sets.setdefault(key, key)
+
+    def put(self, record):
+        record.role_ids = self.intern_roles(record.role_ids)
+        self.guilds.setdefault(record.guild_id, {})[record.id] = record
+        return record
+
+    def add_member(self, member):
+        return self.put(MemberRecord.from_member(member))
+
+    def add_payload(self, guild_id, data):
+        return self.put(MemberRecord.from_payload(guild_id, data))
+
+    def remove(self, guild_id, member_id):
+        return self.guilds.get(int(guild_id), {}).pop(int(member_id), None)
+
+    def get(self, guild_id, member_id):
+        return self.guilds.get(int(guild_id), {}).get(int(member_id))
+
+    def members(self, guild_id):
+        return self.guilds.get(int(guild_id), {}).values()
+
+    def remove_role(self, guild_id, role_id):
+        """Strip a deleted role from every member of guild, returns how many had it"""
+        role_id = int(role_id)
+        changed = 0
+        for record in self.members(guild_id):
+            if role_id in record.role_ids:
+                record.role_ids = self.intern_roles(r for r in record.role_ids if r != role_id)
+                changed += 1
+        return changed
+
+    def clear_guild(self, guild_id):
+        self.guilds.pop(int(guild_id), None)
@@ -0,0 +1,149 @@
+"""
+Bot metrics
+
+Process-wide counters and latency histograms shared by every extension:
+command and component callback latency, outbound REST calls, failures and
+429s per route, gateway events per type and event loop lag. Read by
+/botstats and, when METRICS_PORT is set, served as Prometheus text.
+"""
+
+import asyncio
+import bisect
+import re
+import time
+from collections import Counter
+
+# Histogram bucket upper bounds, in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_component_id_re = re.compile(r"_\d+$")
+
+
+def component_name(custom_id):
+    """Group component callbacks by custom id without their per-user/per-question suffix"""
+    return _component_id_re.sub("", custom_id)
+
+
+class Histogram:
+    __slots__ = ("counts", "count", "sum", "max")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)  # the last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-th quantile (max for the +Inf bucket)"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return BUCKETS[i] if i < len(BUCKETS) else self.max
+        return self.max
+
+
+class Metrics:
+    def __init__(self):
+        self.started = time.time()
+        self.commands = {}  # command name -> Histogram
+        self.components = {}  # component name -> Histogram
+        self.rest_calls = Counter()  # route -> calls
+        self.rest_failures = Counter()  # route -> failed calls
+        self.rest_rate_limited = Counter()  # route -> 429 responses
+        self.gateway_events = Counter()  # event type -> count
+        self.loop_lag = Histogram()
+        self.last_loop_lag = 0.0
+        self.lag_task = None
+
+    def observe(self, table, name, seconds):
+        histogram = table.get(name)
+        if histogram is None:
+            histogram = table[name] = Histogram()
+        histogram.observe(seconds)
+
+    def observe_command(self, name, seconds):
+        self.observe(self.commands, name, seconds)
+
+    def observe_component(self, custom_id, seconds):
+        self.observe(self.components, component_name(custom_id), seconds)
+
+    def rest_call(self, route, status):
+        """Count one REST attempt; status 0 means no response (connection error)"""
+        self.rest_calls[route] += 1
+        if status == 429:
+            self.rest_rate_limited[route] += 1
+        elif status == 0 or status >= 400:
+            self.rest_failures[route] += 1
+
+    def gateway_event(self, event_type):
+        self.gateway_events[event_type] += 1
+
+    def start_loop_monitor(self, interval=1.0):
+        if self.lag_task is None or self.lag_task.done():
+            self.lag_task = asyncio.create_task(self._monitor_loop(interval))
+
+    async def _monitor_loop(self, interval):
+        # How late the loop wakes us up is how long callbacks are waiting to run
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(interval)
+            self.last_loop_lag = max(0.0, time.perf_counter() - start - interval)
+            self.loop_lag.observe(self.last_loop_lag)
+
+    def prometheus(self):
+        """Prometheus text exposition format"""
+        lines = []
+
+        def histogram(metric, label, table):
+            lines.append(f"# TYPE {metric} histogram")
+            for name, hist in sorted(table.items()):
+                labels = f'{label}="{_escape(name)}"' if label else ""
+                cumulative = 0
+                for bound, count in zip(list(BUCKETS) + ["+Inf"], hist.counts):
+                    cumulative += count
+                    sep = "," if labels else ""
+                    lines.append(f'{metric}_bucket{{{labels}{sep}le="{bound}"}} {cumulative}')
+                suffix = f"{{{labels}}}" if labels else ""
+                lines.append(f"{metric}_sum{suffix} {hist.sum}")
+                lines.append(f"{metric}_count{suffix} {hist.count}")
+
+        def counter(metric, label, values):
+            lines.append(f"# TYPE {metric} counter")
+            for name, value in sorted(values.items()):
+                lines.append(f'{metric}{{{label}="{_escape(name)}"}} {value}')
+
+        histogram("piratebot_command_seconds", "command", self.commands)
+        histogram("piratebot_component_seconds", "component", self.components)
+        counter("piratebot_rest_calls_total", "route", self.rest_calls)
+        counter("piratebot_rest_failures_total", "route", self.rest_failures)
+        counter("piratebot_rest_rate_limited_total", "route", self.rest_rate_limited)
+        counter("piratebot_gateway_events_total", "type", self.gateway_events)
+        histogram("piratebot_loop_lag_seconds", None, {"": self.loop_lag})
+        lines.append("# TYPE piratebot_uptime_seconds gauge")
+        lines.append(f"piratebot_uptime_seconds {time.time() - self.started:.0f}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+_metrics = None
+
+
+def get_metrics():
+    """Shared metrics instance used by every extension"""
+    global _metrics
+    if _metrics is None:
+        _metrics = Metrics()
+    return _metrics
@@ -0,0 +1,13 @@
+"""
+Permission checks
+
+Shared by the extensions whose commands are limited to admin officers.
+"""
+
+import interactions
+
+from config import ADMIN_OFFICER_ROLE_ID
+
+
+def is_admin(ctx: interactions.BaseContext):
+    return ADMIN_OFFICER_ROLE_ID in [role.id for role in ctx.author.roles]
@@ -0,0 +1,113 @@
+"""
+Write-behind JSON persistence
+
+Bursts of changes are collapsed into a single write once things have been
+quiet for a short while. The write itself (encoding included) happens in a
+worker thread and replaces the file atomically, so readers never see a
+half-written file and the event loop never blocks on disk I/O. Changes still
+waiting for their delay are written by flush_all() when the bot shuts down.
+"""
+
+import asyncio
+import json
+import os
+import time
+import weakref
+
+from src import logutil
+
+logger = logutil.init_logger(os.path.basename(__file__))
+
+_writers = weakref.WeakSet()  # every DebouncedWriter, for flush_all()
+_flush_tasks = set()  # flushes started by flush_soon(), referenced until they finish
+
+
+def write_json_atomic(path, data, fsync=True):
+    """Compact JSON dump to a temp file, then rename over path.
+    Without fsync the file survives a crashed process but not a crashed machine"""
+    tmp = f"{path}.tmp"
+    with open(tmp, 'w') as f:
+        json.dump(data, f, separators=(',', ':'))
+        if fsync:
+            f.flush()
+            os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+class DebouncedWriter:
+    """Debounced, coalesced writer for one JSON file.
+
+    snapshot is called on the event loop when the write starts and must return
+    a JSON-serialisable object that is not shared with live state.
+    """
+
+    def __init__(self, path, snapshot, delay=2.0, max_delay=30.0):
+        self.path = path
+        self.snapshot = snapshot
+        self.delay = delay
+        self.max_delay = max_delay
+
+        self.dirty = False
+        self.first_change = None
+        self.timer = None
+        self.task = None
+        self.lock = asyncio.Lock()
+        _writers.add(self)
+
+    def schedule(self):
+        """Mark the file dirty; it is written after delay seconds without further changes,
+        and never more than max_delay after the first unsaved change"""
+        now = time.monotonic()
+        if not self.dirty:
+            self.first_change = now
+        self.dirty = True
+
+        if self.timer:
+            self.timer.cancel()
+        delay = max(0.0, min(self.delay, self.first_change + self.max_delay - now))
+        self.timer = asyncio.get_running_loop().call_later(delay, self._start_write)
+
+    def _start_write(self):
+        self.timer = None
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.flush())
+            _flush_tasks.add(self.task)
+            self.task.add_done_callback(_flush_tasks.discard)
+
+    def flush_soon(self):
+        """Start writing unsaved changes now instead of after the delay, e.g. when an extension
+        is dropped. The task is kept referenced until it finishes"""
+        if self.timer:
+            self.timer.cancel()
+        self._start_write()
+        return self.task
+
+    def write_now(self):
+        """Blocking write of unsaved changes, for use once the event loop has stopped"""
+        if self.timer:
+            self.timer.cancel()
+            self.timer = None
+        if self.dirty:
+            self.dirty = False
+            try:
+                write_json_atomic(self.path, self.snapshot())
+            except OSError:
+                logger.exception("Failed to write %s", self.path)
+
+    async def flush(self):
+        """Write now if there are unsaved changes"""
+        async with self.lock:
+            while self.dirty:
+                self.dirty = False
+                data = self.snapshot()
+                try:
+                    await asyncio.to_thread(write_json_atomic, self.path, data)
+                except OSError:
+                    logger.exception("Failed to write %s", self.path)
+
+
+def flush_all():
+    """Write every writer's unsaved changes. Called at shutdown, after the event loop has
+    finished (and with it any write already running in a worker thread)"""
+    for writer in list(_writers):
+        writer.write_now()
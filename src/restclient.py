@@ -0,0 +1,194 @@
+"""
+Shared Discord REST client
+
+One long-lived, connection-pooled aiohttp session that honours Discord's
+per-route rate limit buckets, retries 429s and transient failures with
+backoff, and coalesces identical GET requests that are already in flight.
+"""
+
+import asyncio
+import os
+import re
+import time
+
+import aiohttp
+
+from src import logutil
+from src.metrics import get_metrics
+
+logger = logutil.init_logger(os.path.basename(__file__))
+
+API_BASE = "https://discord.com/api/v10"
+USER_AGENT = "DiscordBot (https://github.com/jjay1288/PirateBot, 1.0)"
+
+# Ids that are part of a route's major parameter keep their value, every other id is templated
+_route_id_re = re.compile(r"(?<!guilds/)(?<!channels/)(?<!webhooks/)\b\d{15,}\b")
+
+
+class RestError(Exception):
+    """A request that failed after retries"""
+
+    def __init__(self, status):
+        super().__init__(f"Request failed with status {status}")
+        self.status = status
+
+
+def route_key(method, path):
+    """Rate limit route for a request, e.g. GET /guilds/123/scheduled-events/{id}"""
+    return f"{method} {_route_id_re.sub('{id}', path)}"
+
+
+class Bucket:
+    """Local view of one rate limit bucket. Requests reserve a slot before they are sent"""
+
+    __slots__ = ("limit", "remaining", "reset_at", "lock", "synced")
+
+    def __init__(self, limit=1):
+        # Until the first response the limit is unknown, so only one request goes out
+        self.limit = limit
+        self.remaining = limit
+        self.reset_at = 0.0  # monotonic time, 0 until a response has told us
+        self.lock = asyncio.Lock()
+        self.synced = asyncio.Event()  # set whenever a response for this bucket arrives
+
+
+class RestClient:
+    """Pooled REST client with rate limit buckets and GET coalescing"""
+
+    def __init__(self, token, max_retries=3, pool_size=20):
+        self.token = token
+        self.max_retries = max_retries
+        self.pool_size = pool_size
+        self.session = None
+
+        self.route_buckets = {}  # route key -> bucket hash from X-RateLimit-Bucket
+        self.buckets = {}  # bucket hash or route key -> Bucket
+        self.global_reset = 0.0
+        self.inflight = {}  # (path, params) -> Future
+        self.metrics = get_metrics()
+
+    async def get_session(self):
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size),
+                headers={"Authorization": f"Bot {self.token}", "User-Agent": USER_AGENT},
+                timeout=aiohttp.ClientTimeout(total=30),
+            )
+        return self.session
+
+    async def close(self):
+        if self.session and not self.session.closed:
+            await self.session.close()
+
+    def _get_bucket(self, route):
+        key = self.route_buckets.get(route, route)
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = Bucket()
+        return bucket
+
+    async def _reserve(self, route):
+        """Wait for and take one request slot in the route's bucket"""
+        now = time.monotonic()
+        if self.global_reset > now:
+            await asyncio.sleep(self.global_reset - now)
+
+        bucket = self._get_bucket(route)
+        # Waiters queue on the lock, so a freed slot goes to the longest waiting request
+        async with bucket.lock:
+            while True:
+                now = time.monotonic()
+                if bucket.reset_at and bucket.reset_at <= now:
+                    bucket.remaining = bucket.limit
+                    bucket.reset_at = 0.0
+                if bucket.remaining > 0:
+                    bucket.remaining -= 1
+                    return
+                if bucket.reset_at:
+                    logger.debug("Bucket for %s exhausted, waiting %.2fs", route, bucket.reset_at - now)
+                    await asyncio.sleep(bucket.reset_at - now)
+                    continue
+                # Slots are all reserved but no response has said when the bucket resets yet
+                bucket.synced.clear()
+                try:
+                    await asyncio.wait_for(bucket.synced.wait(), timeout=5)
+                except asyncio.TimeoutError:
+                    bucket.remaining = 1
+
+    def _update_bucket(self, route, headers):
+        """Re-sync the route's bucket with the response's rate limit headers"""
+        bucket = self._get_bucket(route)
+        bucket_hash = headers.get("X-RateLimit-Bucket")
+        if bucket_hash and self.route_buckets.get(route) != bucket_hash:
+            # First time we learn the shared bucket; requests in flight on the old one still count
+            self.route_buckets[route] = bucket_hash
+            shared = self.buckets.get(bucket_hash)
+            if shared is None:
+                self.buckets[bucket_hash] = bucket
+            else:
+                bucket = shared
+
+        if "X-RateLimit-Remaining" in headers and "X-RateLimit-Reset-After" in headers:
+            remaining = int(headers["X-RateLimit-Remaining"])
+            reset_at = time.monotonic() + float(headers["X-RateLimit-Reset-After"])
+            if "X-RateLimit-Limit" in headers:
+                bucket.limit = int(headers["X-RateLimit-Limit"])
+            if bucket.reset_at and abs(reset_at - bucket.reset_at) < 1.0:
+                # Same window: slots reserved by requests still in flight aren't in the header yet
+                bucket.remaining = min(bucket.remaining, remaining)
+            else:
+                bucket.remaining = remaining
+            bucket.reset_at = reset_at
+        elif not bucket.reset_at:
+            # No rate limit headers (e.g. an error page); give the slot back
+            bucket.remaining = max(bucket.remaining, 1)
+        bucket.synced.set()
+
+    async def request(self, method, path, params=None):
+        """Perform a request, returns (status, json body or None)"""
+        route = route_key(method, path)
+        session = await self.get_session()
+
+        for attempt in range(self.max_retries + 1):
+            await self._reserve(route)
+            try:
+                async with session.request(method, API_BASE + path, params=params) as response:
+                    self._update_bucket(route, response.headers)
+                    self.metrics.rest_call(route, response.status)
+
+                    if response.status == 429:
+                        body = await response.json(content_type=None)
+                        retry_after = float(body.get("retry_after", response.headers.get("Retry-After", 1)))
+                        if body.get("global") or response.headers.get("X-RateLimit-Global"):
+                            self.global_reset = time.monotonic() + retry_after
+                        logger.warning("Rate limited on %s, retrying in %.2fs", route, retry_after)
+                        await asyncio.sleep(retry_after)
+                        continue
+
+                    if response.status >= 500 and attempt < self.max_retries:
+                        logger.warning("%s returned %s, retrying", route, response.status)
+                        await asyncio.sleep(0.5 * 2 ** attempt)
+                        continue
+
+                    data = await response.json(content_type=None) if response.status == 200 else None
+                    return response.status, data
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                self.metrics.rest_call(route, 0)
+                self._update_bucket(route, {})
+                if attempt >= self.max_retries:
+                    logger.error("%s failed: %r", route, e)
+                    return 0, None
+                await asyncio.sleep(0.5 * 2 ** attempt)
+
+        return 429, None
+
+    async def get(self, path, params=None):
+        """GET request; identical requests already in flight share one upstream call.
+        The returned data is shared between callers and must not be mutated"""
+        key = (path, tuple(sorted((params or {}).items())))
+        future = self.inflight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(self.request("GET", path, params))
+            self.inflight[key] = future
+            future.add_done_callback(lambda _: self.inflight.pop(key, None))
+        return await asyncio.shield(future)
@@ -0,0 +1,111 @@
+"""
+Application session store
+
+Half-finished /apply sessions kept as small records (ids and answers only,
+no Discord objects) and saved to disk on every change, so they survive a
+restart: a lost answer would shift every later answer onto the wrong
+question. The file only holds live sessions and changes at the pace people
+type, so it is written straight away, without an fsync so the event loop
+never waits on the disk; the atomic rename still rules out torn files.
+Sessions idle for longer than the timeout are evicted.
+"""
+
+import json
+import os
+import time
+
+from src import logutil
+from src.persist import write_json_atomic
+
+logger = logutil.init_logger(os.path.basename(__file__))
+
+SESSIONS_FILE = 'application_sessions.json'
+
+
+class Session:
+    __slots__ = ("user_id", "username", "dm_channel_id", "answers", "current_selection", "started", "last_active")
+
+    def __init__(self, user_id, username, dm_channel_id, answers=None, current_selection=None, started=None, last_active=None):
+        self.user_id = int(user_id)
+        self.username = username
+        self.dm_channel_id = int(dm_channel_id)
+        self.answers = answers if answers is not None else []
+        self.current_selection = current_selection
+        self.started = started or time.time()
+        self.last_active = last_active or self.started
+
+    def to_json(self):
+        return [self.user_id, self.username, self.dm_channel_id, self.answers, self.current_selection, self.started, self.last_active]
+
+    @classmethod
+    def from_json(cls, data):
+        return cls(*data)
+
+
+class SessionStore:
+    def __init__(self, path=SESSIONS_FILE, idle_timeout=60 * 60):
+        self.path = path
+        self.idle_timeout = idle_timeout
+        self.sessions = {}
+        self.evicted = 0
+
+        if os.path.exists(path):
+            try:
+                with open(path, 'r') as f:
+                    for data in json.load(f):
+                        session = Session.from_json(data)
+                        self.sessions[session.user_id] = session
+            except (OSError, ValueError, TypeError):
+                logger.exception("Failed to load %s, starting without saved sessions", path)
+
+    def to_json(self):
+        return [session.to_json() for session in self.sessions.values()]
+
+    def save(self):
+        try:
+            write_json_atomic(self.path, self.to_json(), fsync=False)
+        except OSError:
+            logger.exception("Failed to write %s", self.path)
+
+    def expired(self, session, now=None):
+        return (now or time.time()) - session.last_active > self.idle_timeout
+
+    def get(self, user_id):
+        """The user's live session, or None. An idle session found here is evicted"""
+        session = self.sessions.get(int(user_id))
+        if session and self.expired(session):
+            self.remove(session.user_id)
+            self.evicted += 1
+            return None
+        return session
+
+    def start(self, user_id, username, dm_channel_id):
+        session = Session(user_id, username, dm_channel_id)
+        self.sessions[session.user_id] = session
+        self.save()
+        return session
+
+    def touch(self, session):
+        """Record activity on a session that was just changed"""
+        session.last_active = time.time()
+        self.save()
+
+    def remove(self, user_id):
+        session = self.sessions.pop(int(user_id), None)
+        if session:
+            self.save()
+        return session
+
+    def evict_idle(self):
+        """Drop every idle session, returns their user ids"""
+        now = time.time()
+        idle = [user_id for user_id, session in self.sessions.items() if self.expired(session, now)]
+        for user_id in idle:
+            del self.sessions[user_id]
+        if idle:
+            self.evicted += len(idle)
+            self.save()
+        return idle
+
+    def stats(self):
+        return {"active": len(self.sessions), "evicted": self.evicted}
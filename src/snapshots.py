@@ -0,0 +1,169 @@
+"""
+Roster snapshot history
+
+Periodic snapshots of member id -> (squadron, nick, role ids) kept in an
+append-only JSON lines file. Most lines only hold the changes since the
+previous snapshot; a full snapshot is written every few entries and their
+byte offsets are indexed, so a lookup seeks to the nearest full snapshot and
+replays only the deltas after it. Diffs between two dates are computed from
+this file alone.
+"""
+
+import bisect
+import json
+import os
+import re
+from datetime import datetime, timezone
+
+SNAPSHOT_FILE = 'roster_snapshots.jsonl'
+
+# Every line starts with its date, so it can be read without decoding the whole line
+_date_re = re.compile(r'^\{"date":"([^"]+)"')
+
+
+def _record(value):
+    squadron, nick, roles = value
+    return (squadron, nick, tuple(roles))
+
+
+def _parse_date(value):
+    return datetime.fromisoformat(value)
+
+
+def _line_date(line):
+    match = _date_re.match(line)
+    return _parse_date(match.group(1)) if match else _parse_date(json.loads(line)["date"])
+
+
+def _is_full(line):
+    # A quote can't appear unescaped inside a JSON string, so this only matches the key
+    return '"full":' in line
+
+
+class SnapshotStore:
+    def __init__(self, path=SNAPSHOT_FILE, full_every=12):
+        self.path = path
+        self.full_every = full_every
+
+        # (date, byte offset) of every full snapshot line, oldest first
+        self.full_dates = []
+        self.full_offsets = []
+
+        # Materialised state of the newest snapshot, used to compute the next delta
+        self.latest = {}
+        self.latest_date = None
+        self.since_full = 0
+
+        self._build_index()
+        if self.full_offsets:
+            replayed = 0
+            for self.latest_date, self.latest in self._replay(self.full_offsets[-1]):
+                replayed += 1
+            self.since_full = replayed - 1
+
+    def _build_index(self):
+        """Find the full snapshot lines without decoding or replaying the deltas"""
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'r') as f:
+            offset = f.tell()
+            for line in iter(f.readline, ''):
+                if line.strip() and _is_full(line):
+                    self.full_dates.append(_line_date(line))
+                    self.full_offsets.append(offset)
+                offset = f.tell()
+
+    def _replay(self, offset, until=None):
+        """Yield (date, state) for each snapshot from the full line at offset on, stopping
+        before the first one taken after until. The same state dict is updated in place"""
+        state = {}
+        with open(self.path, 'r') as f:
+            f.seek(offset)
+            for line in iter(f.readline, ''):
+                if not line.strip():
+                    continue
+                if until is not None and _line_date(line) > until:
+                    return
+                entry = json.loads(line)
+                if "full" in entry:
+                    state = {int(k): _record(v) for k, v in entry["full"].items()}
+                else:
+                    for k, v in entry.get("changed", {}).items():
+                        state[int(k)] = _record(v)
+                    for k in entry.get("removed", []):
+                        state.pop(int(k), None)
+                yield _parse_date(entry["date"]), state
+
+    def record(self, state, when=None):
+        """Append a snapshot of {member id: (squadron, nick, role ids)}.
+        Returns the number of members that changed since the previous snapshot"""
+        when = when or datetime.now(timezone.utc)
+        state = {int(k): _record(v) for k, v in state.items()}
+
+        changed = {str(k): v for k, v in state.items() if self.latest.get(k) != v}
+        removed = [str(k) for k in self.latest if k not in state]
+
+        entry = {"date": when.isoformat()}
+        is_full = self.latest_date is None or self.since_full + 1 >= self.full_every
+        if is_full:
+            entry["full"] = {str(k): v for k, v in state.items()}
+            self.since_full = 0
+        else:
+            entry["changed"] = changed
+            entry["removed"] = removed
+            self.since_full += 1
+
+        with open(self.path, 'a') as f:
+            offset = f.tell()
+            f.write(json.dumps(entry, separators=(',', ':')) + "\n")
+        if is_full:
+            self.full_dates.append(when)
+            self.full_offsets.append(offset)
+
+        self.latest, self.latest_date = state, when
+        return len(changed) + len(removed)
+
+    def state_at(self, when):
+        """(date, state) of the newest snapshot taken at or before when.
+        Falls back to the oldest snapshot when none is that old"""
+        if not self.full_offsets:
+            return None
+        # Replay starts at the last full snapshot at or before when, so at most full_every lines are read
+        i = max(0, bisect.bisect_right(self.full_dates, when) - 1)
+        found = None
+        for date, state in self._replay(self.full_offsets[i], until=when):
+            found = date
+        if found is None:
+            # when is older than every snapshot: the oldest one is a full line
+            date, state = next(self._replay(self.full_offsets[0]))
+            return date, dict(state)
+        return found, dict(state)
+
+    def diff(self, since, until):
+        """Changes between the snapshots in effect at since and until"""
+        start = self.state_at(since)
+        end = self.state_at(until)
+        if start is None or end is None:
+            return None
+
+        (start_date, before), (end_date, after) = start, end
+        joined = [after[k] for k in after if k not in before]
+        left = [before[k] for k in before if k not in after]
+        moved = [
+            (after[k][1], before[k][0], after[k][0])
+            for k in after
+            if k in before and before[k][0] != after[k][0]
+        ]
+        renamed = [
+            (before[k][1], after[k][1])
+            for k in after
+            if k in before and before[k][1] != after[k][1]
+        ]
+        return {
+            "from": start_date,
+            "to": end_date,
+            "joined": joined,
+            "left": left,
+            "moved": moved,
+            "renamed": renamed,
+        }
@@ -0,0 +1,204 @@
+"""
+Member to squadron index
+
+Classifies every guild member into a squadron once and keeps the result
+current from gateway events, so the roster, RSVP and application handler
+look squadrons up instead of re-walking everyone's roles.
+
+A member with several squadron roles belongs to the one listed first in
+sq_roles.json.
+
+With compact=True the index also keeps a MemberCache, loaded page by page
+over REST instead of by chunking, and the other extensions read members
+from it rather than from the library's member cache.
+"""
+
+import asyncio
+import os
+
+from src import logutil
+from src.configcache import squadron_roles
+from src.membercache import MemberCache, MemberRecord
+
+logger = logutil.init_logger(os.path.basename(__file__))
+
+UNASSIGNED = "Unassigned"
+MEMBER_PAGE_SIZE = 1000
+
+
+def get_leadership_post(nick):
+    if nick and "[HVY]CO" in nick:
+        return "CO"
+    if nick and "[HVY]XO" in nick:
+        return "XO"
+    return None
+
+
+class SquadronIndex:
+    """member id -> squadron, per-squadron member sets and CO/XO per squadron role"""
+
+    def __init__(self, bot, compact=False):
+        self.bot = bot
+        self.member_cache = MemberCache() if compact else None
+        self.ready = False
+        self.build_task = None
+        self.roles_source = None
+
+        self.role_priority = {}  # role id -> (priority, squadron name)
+        self.squadron_names = []  # unique squadron names in priority order
+
+        self.member_squadron = {}  # member id -> squadron name
+        self.members = {UNASSIGNED: set()}  # squadron name -> member ids
+
+        self.leaders = {}  # squadron role id -> {"CO": member id, "XO": member id}
+        self.leader_posts = {}  # member id -> [(role id, post)]
+
+        self.check_roles()
+
+    def _load_roles(self, roles):
+        self.roles_source = roles
+        self.role_priority = {int(role_id): (i, name) for i, (role_id, name) in enumerate(roles.items())}
+        self.squadron_names = list(dict.fromkeys(roles.values()))
+
+    def check_roles(self):
+        """Reclassify everyone from the member cache if sq_roles.json changed"""
+        roles = squadron_roles()
+        if roles is self.roles_source:
+            return
+        first_load = self.roles_source is None
+        self._load_roles(roles)
+        if not first_load:
+            logger.info("Squadron roles changed, reindexing members")
+            self.reindex()
+
+    def reindex(self):
+        """Rebuild from the member cache"""
+        self.member_squadron = {}
+        self.members = {name: set() for name in self.squadron_names}
+        self.members[UNASSIGNED] = set()
+        self.leaders = {}
+        self.leader_posts = {}
+        for guild in self.bot.guilds:
+            for record in self.guild_members(guild):
+                self.index_record(record)
+
+    def remove_role(self, guild_id, role_id):
+        """A role was deleted; records in the compact cache still list it, so strip it first"""
+        if self.member_cache is not None:
+            self.member_cache.remove_role(guild_id, role_id)
+        self.reindex()
+
+    def guild_members(self, guild):
+        """MemberRecords for every cached member of guild"""
+        if self.member_cache is not None:
+            return list(self.member_cache.members(guild.id))
+        return [MemberRecord.from_member(member) for member in guild.members]
+
+    def get_member(self, guild_id, member_id):
+        """MemberRecord of a cached member, or None"""
+        if self.member_cache is not None:
+            return self.member_cache.get(guild_id, member_id)
+        member = self.bot.cache.get_member(guild_id, member_id)
+        return MemberRecord.from_member(member) if member else None
+
+    async def load_members(self, guild):
+        """Fill the compact cache from the REST member list, without building Member objects"""
+        self.member_cache.clear_guild(guild.id)
+        after = None
+        while True:
+            page = await self.bot.http.list_members(guild.id, limit=MEMBER_PAGE_SIZE, after=after)
+            for data in page:
+                self.member_cache.add_payload(guild.id, data)
+            if len(page) < MEMBER_PAGE_SIZE:
+                break
+            after = page[-1]["user"]["id"]
+
+    async def build(self):
+        """Load every guild's members and classify them. Concurrent callers share one build"""
+        if self.build_task is None or self.build_task.done():
+            self.build_task = asyncio.ensure_future(self._build())
+        await asyncio.shield(self.build_task)
+
+    async def _build(self):
+        self.check_roles()
+        for guild in self.bot.guilds:
+            if self.member_cache is not None:
+                await self.load_members(guild)
+            else:
+                await guild.chunk()
+        self.reindex()
+        self.ready = True
+        logger.debug("Squadron index built: %s members", len(self.member_squadron))
+
+    def classify(self, role_ids):
+        """Squadron for a set of role ids, by sq_roles.json priority"""
+        best = None
+        for role_id in role_ids:
+            entry = self.role_priority.get(int(role_id))
+            if entry and (best is None or entry < best):
+                best = entry
+        return best[1] if best else UNASSIGNED
+
+    def index_member(self, member):
+        if self.member_cache is not None:
+            record = self.member_cache.add_member(member)
+        else:
+            record = MemberRecord.from_member(member)
+        self.index_record(record)
+
+    def index_record(self, record):
+        self._set_squadron(record.id, self.classify(record.role_ids))
+        self._set_leadership(record.id, record.nick, record.role_ids)
+
+    def _set_squadron(self, member_id, squadron):
+        previous = self.member_squadron.get(member_id)
+        if previous == squadron:
+            return
+        if previous is not None:
+            self.members[previous].discard(member_id)
+        self.member_squadron[member_id] = squadron
+        self.members.setdefault(squadron, set()).add(member_id)
+
+    def _set_leadership(self, member_id, nick, role_ids):
+        self._clear_leadership(member_id)
+        post = get_leadership_post(nick)
+        if not post:
+            return
+
+        posts = []
+        for role_id in role_ids:
+            if role_id in self.role_priority:
+                self.leaders.setdefault(role_id, {"CO": None, "XO": None})[post] = member_id
+                posts.append((role_id, post))
+        if posts:
+            self.leader_posts[member_id] = posts
+
+    def _clear_leadership(self, member_id):
+        for role_id, post in self.leader_posts.pop(member_id, []):
+            if self.leaders.get(role_id, {}).get(post) == member_id:
+                self.leaders[role_id][post] = None
+
+    def remove_member(self, member_id, guild_id=None):
+        if self.member_cache is not None and guild_id is not None:
+            self.member_cache.remove(guild_id, member_id)
+        squadron = self.member_squadron.pop(member_id, None)
+        if squadron is not None:
+            self.members[squadron].discard(member_id)
+        self._clear_leadership(member_id)
+
+    def squadron_of(self, member_id):
+        """Squadron name, or None if the member isn't indexed"""
+        self.check_roles()
+        return self.member_squadron.get(int(member_id))
+
+    def members_of(self, squadron):
+        self.check_roles()
+        return self.members.get(squadron, set())
+
+    def counts(self):
+        self.check_roles()
+        return {name: len(self.members.get(name, ())) for name in self.squadron_names + [UNASSIGNED]}
+
+    def leadership(self, role_id):
+        self.check_roles()
+        return dict(self.leaders.get(int(role_id), {"CO": None, "XO": None}))
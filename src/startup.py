@@ -0,0 +1,93 @@
+"""
+Startup timeline
+
+Records how long each extension takes to import, construct and run its
+Ready listeners, plus a few milestones (client created, logged in), so
+slow startups can be pinned on a specific extension. The report is logged
+once every Ready listener has finished and can be shown with /startupreport.
+"""
+
+import contextlib
+import functools
+import os
+import time
+
+from src import logutil
+
+logger = logutil.init_logger(os.path.basename(__file__))
+
+PHASES = ("import", "load", "ready")
+
+
+class StartupTimeline:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.milestones = {}  # name -> seconds since start
+        self.extensions = {}  # extension module -> {phase: seconds}
+        self.deferred = set()
+        self.pending_ready = set()  # listeners whose first Ready run hasn't finished
+        self.reported = False
+
+    def mark(self, name):
+        self.milestones.setdefault(name, time.perf_counter() - self.started)
+
+    def record(self, extension, phase, seconds):
+        phases = self.extensions.setdefault(extension, {})
+        phases[phase] = phases.get(phase, 0.0) + seconds
+
+    @contextlib.contextmanager
+    def measure(self, extension, phase):
+        """Time a block as one phase of an extension"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(extension, phase, time.perf_counter() - start)
+
+    def wrap_ready_listeners(self, extension, ext):
+        """Time the first run of each of ext's Ready listeners"""
+        for listener in ext.listeners:
+            if listener.event != "ready":
+                continue
+            key = (extension, listener.callback.__name__)
+            self.expect(key)
+            listener.callback = self._timed(extension, key, listener.callback)
+
+    def _timed(self, extension, key, callback):
+        @functools.wraps(callback)
+        async def timed(*args, **kwargs):
+            if key not in self.pending_ready:
+                return await callback(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return await callback(*args, **kwargs)
+            finally:
+                self.record(extension, "ready", time.perf_counter() - start)
+                self.finish(key)
+
+        return timed
+
+    def expect(self, key):
+        """Hold the report back until finish(key), e.g. for an extension loaded later"""
+        self.pending_ready.add(key)
+
+    def finish(self, key):
+        self.pending_ready.discard(key)
+        if not self.pending_ready and not self.reported:
+            self.reported = True
+            self.mark("all_ready")
+            logger.info("%s", "\n".join(self.report()))
+
+    def report(self):
+        lines = ["Startup timeline:"]
+        for name, seconds in sorted(self.milestones.items(), key=lambda item: item[1]):
+            lines.append(f"  {name}: {seconds:.2f}s after start")
+        rows = sorted(self.extensions.items(), key=lambda item: -sum(item[1].values()))
+        for extension, phases in rows:
+            timings = ", ".join(f"{phase} {phases[phase]:.2f}s" for phase in PHASES if phase in phases)
+            deferred = " (deferred)" if extension in self.deferred else ""
+            lines.append(f"  {extension}{deferred}: {timings}")
+        if self.pending_ready:
+            lines.append(f"  Ready listeners still running: {len(self.pending_ready)}")
+        return lines
+
@@ -0,0 +1,32 @@
+"""
+Step timing helper
+
+Records how long each named step of a workflow takes so slow steps show up in the logs.
+"""
+
+import time
+
+
+class StepTimer:
+    """Collects per-step durations for one workflow run"""
+
+    def __init__(self, name):
+        self.name = name
+        self.started = time.perf_counter()
+        self.steps = {}
+
+    async def run(self, step, coro):
+        """Await coro and record its duration under step"""
+        start = time.perf_counter()
+        try:
+            return await coro
+        finally:
+            self.steps[step] = time.perf_counter() - start
+
+    @property
+    def total(self):
+        return time.perf_counter() - self.started
+
+    def summary(self):
+        steps = ", ".join(f"{step}={duration * 1000:.0f}ms" for step, duration in self.steps.items())
+        return f"{self.name} took {self.total * 1000:.0f}ms ({steps})"